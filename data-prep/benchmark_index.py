@@ -0,0 +1,70 @@
+"""
+Benchmark FAISS index types on an embedding store: recall@k against exact flat
+search, queries/sec, build time and serialized index size.
+"""
+import time
+import argparse
+import numpy as np
+import faiss
+from embedding_store import EmbeddingStore
+from vector_index import INDEX_TYPES, build_index, configure_search
+
+def search_timed(index, queries, k):
+    start = time.perf_counter()
+    _, ids = index.search(queries, k)
+    elapsed = time.perf_counter() - start
+    return ids, len(queries) / elapsed if elapsed else float('inf')
+
+def recall_at_k(ids, truth):
+    hits = sum(len(set(row[row >= 0]) & set(true_row)) for row, true_row in zip(ids, truth))
+    return hits / truth.size
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare FAISS index types on an embedding store")
+    parser.add_argument("store", help="Path to the embedding store directory")
+    parser.add_argument("--types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES),
+                       help="Index types to benchmark")
+    parser.add_argument("--k", type=int, default=10, help="Neighbors per query")
+    parser.add_argument("--queries", type=int, default=1000, help="Number of stored vectors used as queries")
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--pq-m", type=int, default=None)
+    parser.add_argument("--hnsw-m", type=int, default=None)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=None, help="FAISS OpenMP threads (default: all cores)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.threads:
+        faiss.omp_set_num_threads(args.threads)
+
+    store = EmbeddingStore(args.store)
+    vectors = store.vectors()
+    rng = np.random.default_rng(args.seed)
+    query_ids = np.sort(rng.choice(len(store), size=min(args.queries, len(store)), replace=False))
+    queries = np.ascontiguousarray(vectors[query_ids], dtype=np.float32)
+    params = {'nlist': args.nlist, 'pq_m': args.pq_m, 'hnsw_m': args.hnsw_m}
+
+    print(f"INFO: {len(store)} vectors (dimension: {store.dim}, {store.dtype}), {len(queries)} queries, k={args.k}")
+
+    # Exact search is the ground truth for recall
+    flat, _ = build_index(store, 'flat')
+    truth, _ = search_timed(flat, queries, args.k)
+
+    rows = []
+    for kind in args.types:
+        start = time.perf_counter()
+        index, built = build_index(store, kind, params)
+        build_time = time.perf_counter() - start
+        configure_search(index, nprobe=args.nprobe, ef_search=args.ef_search)
+        ids, qps = search_timed(index, queries, args.k)
+        size_mb = faiss.serialize_index(index).nbytes / (1024 * 1024)
+        rows.append((kind, recall_at_k(ids, truth), qps, build_time, size_mb, built))
+
+    print(f"\n| Index | Recall@{args.k} | Queries/sec | Build (s) | Size (MB) | Params |")
+    print("|-------|-----------|-------------|-----------|-----------|--------|")
+    for kind, recall, qps, build_time, size_mb, built in rows:
+        print(f"| {kind} | {recall:.4f} | {qps:,.0f} | {build_time:.2f} | {size_mb:.1f} | {built} |")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Benchmark the Arrow-native transforms of template-only sources against the
+row-by-row path: rows/sec of each, speedup, and whether both produce the same
+records.
+"""
+import time
+import argparse
+from datasets import concatenate_datasets
+from prepare_engine import BATCH_SIZE, DATA_DIR, load_registry, load_source_dataset, template_records
+from arrow_transforms import vectorized_table
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    registry = load_registry()
+    template_sources = [name for name, source in registry.items() if source.llm is None]
+    parser = argparse.ArgumentParser(description="Compare Arrow-native and row-by-row template transforms")
+    parser.add_argument("--sources", nargs="+", choices=template_sources, default=template_sources,
+                       help="Template-only sources to benchmark")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Directory download_all.py wrote the datasets to")
+    parser.add_argument("--repeat", type=int, default=1, help="Tile each dataset this many times")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Rows decoded per batch on the row-by-row path")
+    args = parser.parse_args()
+
+    rows = []
+    for name in args.sources:
+        source = registry[name]
+        try:
+            ds = load_source_dataset(source, args.data_dir)
+        except FileNotFoundError as e:
+            print(f"WARNING: {e}")
+            continue
+        if args.repeat > 1:
+            ds = concatenate_datasets([ds] * args.repeat)
+        print(f"INFO: {name}: {len(ds)} rows")
+
+        expected, row_time = timed(lambda: list(template_records(source, ds, args.batch_size)))
+        table, arrow_time = timed(lambda: vectorized_table(source, ds.with_format('arrow')[:]))
+        if table is None:
+            print(f"WARNING: {name} has templates without an Arrow equivalent; skipped")
+            continue
+        records, decode_time = timed(table.to_pylist)
+        rows.append((name, len(ds), len(records), len(ds) / row_time, len(ds) / arrow_time,
+                     len(ds) / (arrow_time + decode_time), row_time / arrow_time, records == expected))
+
+    print("\n| Source | Rows | Records | Per-row rows/sec | Arrow rows/sec | Arrow + to_pylist rows/sec | Speedup | Same records |")
+    print("|--------|------|---------|------------------|----------------|----------------------------|---------|--------------|")
+    for name, total, kept, row_rate, arrow_rate, decoded_rate, speedup, same in rows:
+        print(f"| {name} | {total:,} | {kept:,} | {row_rate:,.0f} | {arrow_rate:,.0f} | {decoded_rate:,.0f} | "
+              f"{speedup:.1f}x | {'yes' if same else 'NO'} |")
+
+
+if __name__ == "__main__":
+    main()
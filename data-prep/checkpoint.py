@@ -0,0 +1,227 @@
+"""
+Append-only JSONL checkpoint shared by the prepare_* scripts.
+
+Each generated record is appended as one line to `<output>.jsonl` (fsynced every
+few records), so checkpointing costs O(1) per row instead of re-serializing the
+whole dataset. The final pretty-printed JSON array is exported once at the end.
+
+HashIndex keeps the normalized-text hashes of one field next to the checkpoint,
+so duplicate checks are O(1) and resuming does not re-parse every record.
+"""
+import os
+import re
+import json
+import hashlib
+import unicodedata
+
+FSYNC_EVERY = 50
+
+
+def repair_tail(path, chunk_size=64 * 1024):
+    """Truncate a torn last line (an interrupted write) so appends start on a fresh line"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        while pos > 0:
+            start = max(0, pos - chunk_size)
+            f.seek(start)
+            newline = f.read(pos - start).rfind(b'\n')
+            if newline >= 0:
+                pos = start + newline + 1
+                break
+            pos = start
+        if pos < end:
+            f.truncate(pos)
+            print(f"WARNING: Dropped a torn last line ({end - pos} bytes) from {path}")
+
+
+def checkpoint_path_for(output_path):
+    """Return the JSONL checkpoint path that backs a final JSON output"""
+    return os.path.splitext(output_path)[0] + '.jsonl'
+
+
+class JsonlCheckpoint:
+    def __init__(self, output_path, fsync_every=FSYNC_EVERY):
+        self.output_path = output_path
+        self.path = checkpoint_path_for(output_path)
+        self.fsync_every = fsync_every
+        self.count = 0
+        self._pending = 0
+        self._file = None
+        if not os.path.exists(self.path):
+            self._seed_from_output()
+
+    def _seed_from_output(self):
+        """Convert a JSON array left by an older run into the JSONL checkpoint"""
+        if not os.path.exists(self.output_path):
+            return
+        with open(self.output_path, 'r', encoding='utf-8') as f:
+            try:
+                records = json.load(f)
+            except Exception:
+                return
+        if not isinstance(records, list):
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        print(f"INFO: Seeded checkpoint {self.path} with {len(records)} records from {self.output_path}")
+
+    def __iter__(self):
+        """Stream the records already in the checkpoint"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn last line from an interrupted write; drop it
+                    continue
+
+    def load(self):
+        """Stream existing records and count them, for resume logic"""
+        self.count = 0
+        for record in self:
+            self.count += 1
+            yield record
+
+    def _open(self):
+        repair_tail(self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def append(self, record):
+        if self._file is None:
+            self._open()
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+        self.count += 1
+        self._pending += 1
+        if self._pending >= self.fsync_every:
+            os.fsync(self._file.fileno())
+            self._pending = 0
+
+    def extend(self, records):
+        """Append many records with a single fsync"""
+        if self._file is None:
+            self._open()
+        for record in records:
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.count += 1
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def clear(self):
+        """Drop every checkpointed record, for outputs rebuilt from scratch on each run"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.count = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+            self._pending = 0
+
+    def export(self, output_path=None):
+        """Write the checkpoint once as the final indented JSON array"""
+        self.close()
+        output_path = output_path or self.output_path
+        tmp_path = output_path + '.tmp'
+        total = 0
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('[')
+            for record in self:
+                item = json.dumps(record, indent=2, ensure_ascii=False)
+                f.write(',\n  ' if total else '\n  ')
+                f.write(item.replace('\n', '\n  '))
+                total += 1
+            f.write('\n]' if total else ']')
+        os.replace(tmp_path, output_path)
+        return total
+
+
+def normalize_text(text):
+    """Case-, whitespace- and punctuation-insensitive form of a text, for duplicate checks"""
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    return ' '.join(re.sub(r'[^\w\s]', ' ', text).split())
+
+
+def text_key(text):
+    return hashlib.sha1(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+class HashIndex:
+    """
+    Normalized-text hashes of one field of a checkpoint's records, persisted as
+    `<checkpoint>.<field>.idx` with one hash per record. The checkpoint is only
+    re-read when the index does not cover exactly its records (e.g. after a
+    crash between the two appends).
+    """
+
+    def __init__(self, checkpoint, field='input'):
+        self.checkpoint = checkpoint
+        self.field = field
+        self.path = f'{checkpoint.path}.{field}.idx'
+        self._file = None
+
+        records = self._count_records()
+        lines = []
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.read().split()
+        if len(lines) != records:
+            lines = self._rebuild()
+        self.records = len(lines)
+        self.keys = set(lines)
+
+    def _count_records(self):
+        if not os.path.exists(self.checkpoint.path):
+            return 0
+        count = 0
+        with open(self.checkpoint.path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                count += block.count(b'\n')
+        return count
+
+    def _rebuild(self):
+        lines = [text_key(record.get(self.field, '')) for record in self.checkpoint]
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(''.join(line + '\n' for line in lines))
+        os.replace(self.path + '.tmp', self.path)
+        print(f"INFO: Rebuilt {self.path} from {len(lines)} checkpointed records")
+        return lines
+
+    def __contains__(self, text):
+        return text_key(text) in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, text):
+        """Record the text of a record just appended to the checkpoint"""
+        key = text_key(text)
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(key + '\n')
+        self._file.flush()
+        self.keys.add(key)
+        self.records += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
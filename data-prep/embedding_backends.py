@@ -0,0 +1,217 @@
+"""
+Embedding backends for the vectorizing step.
+
+    cohere   Cohere embed API (needs COHERE_API_KEY)
+    hashing  deterministic feature-hashing embedder; runs offline, so the
+             pipeline can be tested and benchmarked without network or quota
+
+embed_texts() packs texts into batches bounded by item count and an estimated
+token budget, keeps EMBED_CONCURRENCY batches in flight, and backs off on rate
+limits: a 429 pauses every worker, not only the one that hit it. Throughput is
+reported when the run finishes.
+"""
+import os
+import re
+import time
+import zlib
+import random
+import threading
+import numpy as np
+from tqdm import tqdm
+from run_ollama import run_concurrently
+
+# Batches kept in flight at once
+EMBED_CONCURRENCY = int(os.getenv('EMBED_CONCURRENCY', '4'))
+# Estimated tokens per request; batches are also capped by the backend's item limit
+EMBED_BATCH_TOKENS = int(os.getenv('EMBED_BATCH_TOKENS', '16000'))
+EMBED_MAX_RETRIES = int(os.getenv('EMBED_MAX_RETRIES', '8'))
+# Simulated per-request latency of the hashing backend, to benchmark concurrency offline
+EMBED_HASHING_LATENCY = float(os.getenv('EMBED_HASHING_LATENCY', '0'))
+
+try:
+    import httpx
+    # The Cohere SDK surfaces timeouts and dropped connections as httpx transport errors
+    TRANSIENT_ERRORS = (TimeoutError, ConnectionError, httpx.TimeoutException, httpx.NetworkError,
+                        httpx.RemoteProtocolError)
+except ImportError:
+    TRANSIENT_ERRORS = (TimeoutError, ConnectionError)
+
+# Vectors written before the backend was recorded in the manifest came from here
+LEGACY_MODEL_ID = 'cohere:embed-v4.0'
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English prose; only used to size batches
+    return len(text) // 4 + 1
+
+
+class EmbeddingBackend:
+    name = None
+    max_batch_items = 96
+
+    @property
+    def model_id(self):
+        """Identifies the vector space; vectors from different ids must not share a store"""
+        raise NotImplementedError
+
+    def embed(self, texts):
+        """Return one embedding (list or array of floats) per text"""
+        raise NotImplementedError
+
+    def retry_after(self, error):
+        """
+        Seconds to wait before retrying after `error` (0 means use exponential
+        backoff), or None if it is not retryable. Rate limits (HTTP 429, honouring
+        Retry-After), server errors and timeouts are retried.
+        """
+        status = getattr(error, 'status_code', None)
+        if status == 429 or type(error).__name__ == 'TooManyRequestsError':
+            headers = getattr(error, 'headers', None) or {}
+            try:
+                return float(headers.get('retry-after') or headers.get('Retry-After'))
+            except (TypeError, ValueError):
+                return 0.0
+        if status in (500, 502, 503, 504) or isinstance(error, TRANSIENT_ERRORS):
+            return 0.0
+        return None
+
+
+class CohereBackend(EmbeddingBackend):
+    name = 'cohere'
+    max_batch_items = 96  # Cohere embed limit per request
+
+    def __init__(self, model='embed-v4.0', input_type='search_document', api_key=None):
+        import cohere
+        api_key = api_key or os.getenv('COHERE_API_KEY')
+        if not api_key:
+            raise ValueError('Set COHERE_API_KEY env variable')
+        self.client = cohere.Client(api_key)
+        self.model = model
+        self.input_type = input_type
+
+    @property
+    def model_id(self):
+        return f'cohere:{self.model}'
+
+    def embed(self, texts):
+        resp = self.client.embed(texts=texts, model=self.model, input_type=self.input_type)
+        return resp.embeddings
+
+
+class HashingBackend(EmbeddingBackend):
+    """
+    Signed feature hashing of word unigrams and bigrams. Deterministic and
+    offline; `latency` (seconds per request) simulates an API round trip.
+    """
+    name = 'hashing'
+    max_batch_items = 96
+
+    def __init__(self, dim=1536, latency=EMBED_HASHING_LATENCY):
+        self.dim = dim
+        self.latency = latency
+
+    @property
+    def model_id(self):
+        return f'hashing:{self.dim}'
+
+    def _embed_one(self, text):
+        words = re.findall(r'\w+', text.lower())
+        features = words + [a + ' ' + b for a, b in zip(words, words[1:])]
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if features:
+            hashes = np.array([zlib.crc32(f.encode('utf-8')) for f in features], dtype=np.uint64)
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+            np.add.at(vector, (hashes % self.dim).astype(np.int64), signs)
+        return vector
+
+    def embed(self, texts):
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed_one(text) for text in texts]
+
+
+BACKENDS = {'cohere': CohereBackend, 'hashing': HashingBackend}
+
+
+def get_backend(name, **kwargs):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {name} (expected one of {tuple(BACKENDS)})")
+    return BACKENDS[name](**kwargs)
+
+
+def make_batches(texts, max_items, max_tokens=EMBED_BATCH_TOKENS):
+    """Consecutive (start, end) slices of at most max_items texts and ~max_tokens tokens"""
+    start, tokens = 0, 0
+    for i, text in enumerate(texts):
+        cost = estimate_tokens(text)
+        if i > start and (i - start >= max_items or tokens + cost > max_tokens):
+            yield start, i
+            start, tokens = i, 0
+        tokens += cost
+    if start < len(texts):
+        yield start, len(texts)
+
+
+class _Backoff:
+    """Shared pause: once any request is rate limited, no worker sends until it expires"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._until = 0.0
+        self.retries = 0
+
+    def wait(self):
+        while True:
+            with self._lock:
+                delay = self._until - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        with self._lock:
+            self.retries += 1
+            self._until = max(self._until, time.monotonic() + seconds)
+
+
+def _embed_with_retry(backend, texts, backoff, max_retries):
+    for attempt in range(max_retries + 1):
+        backoff.wait()
+        try:
+            return backend.embed(texts)
+        except Exception as e:
+            retry_after = backend.retry_after(e)
+            if retry_after is None or attempt == max_retries:
+                raise
+            # Honour Retry-After when given, otherwise exponential backoff with jitter
+            delay = retry_after or min(60.0, 2 ** attempt) * (0.5 + random.random())
+            print(f"WARNING: Embedding request failed ({e}); retrying in {delay:.1f}s")
+            backoff.pause(delay)
+
+
+def embed_texts(backend, texts, concurrency=EMBED_CONCURRENCY, max_tokens=EMBED_BATCH_TOKENS,
+                max_retries=EMBED_MAX_RETRIES):
+    """
+    Embed `texts` and yield (start, embeddings) for consecutive slices, in order,
+    so callers can persist each batch as soon as it arrives.
+    """
+    batches = list(make_batches(texts, backend.max_batch_items, max_tokens))
+    backoff = _Backoff()
+    embed = lambda span: _embed_with_retry(backend, texts[span[0]:span[1]], backoff, max_retries)
+
+    started = time.perf_counter()
+    done_texts = done_tokens = 0
+    with tqdm(total=len(texts), unit='text') as progress:
+        for (start, end), embeddings, error in run_concurrently(embed, batches, concurrency):
+            if error is not None:
+                raise error
+            done_texts += end - start
+            done_tokens += sum(estimate_tokens(t) for t in texts[start:end])
+            progress.update(end - start)
+            yield start, embeddings
+
+    elapsed = time.perf_counter() - started
+    if done_texts:
+        print(f"INFO: Embedded {done_texts} texts in {len(batches)} batches with {backend.model_id} "
+              f"(concurrency {concurrency}, {backoff.retries} retries) in {elapsed:.1f}s: "
+              f"{done_texts / elapsed:.1f} texts/s, ~{done_tokens / elapsed:,.0f} tokens/s")
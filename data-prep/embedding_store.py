@@ -0,0 +1,274 @@
+"""
+Binary, append-only store for chunk embeddings.
+
+A store is a directory holding:
+    store.json   header: dim, dtype, row count and committed file sizes
+    vectors.bin  row-major matrix (float32, float16 or int8)
+    scales.bin   float32 per-row scales (int8 stores only)
+    texts.bin    UTF-8 chunk texts, concatenated
+    meta.jsonl   one line per row: pdf, chunk_id, text_hash and the text offset/length
+
+Vectors are L2-normalized on write (we only ever search by cosine similarity),
+so float32 stores can be memory-mapped and handed to FAISS without a copy.
+store.json is rewritten atomically after each append and is the source of
+truth: bytes written past the committed sizes by an interrupted run are
+truncated on the next append.
+
+store.json also carries a fingerprint chained over every appended batch and the
+(count, fingerprint) history, so an index built over the first N rows can tell
+whether it is still a valid prefix of the store and only needs the new rows.
+"""
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+
+DTYPES = ('float32', 'float16', 'int8')
+HEADER = 'store.json'
+VECTORS = 'vectors.bin'
+SCALES = 'scales.bin'
+TEXTS = 'texts.bin'
+META = 'meta.jsonl'
+
+
+def normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class EmbeddingStore:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, HEADER), 'r', encoding='utf-8') as f:
+            self.header = json.load(f)
+        self.dim = self.header['dim']
+        self.dtype = self.header['dtype']
+        self._meta = None
+        self._texts = None
+
+    @classmethod
+    def create(cls, path, dim, dtype='float32'):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported embedding dtype: {dtype} (expected one of {DTYPES})")
+        os.makedirs(path, exist_ok=True)
+        header = {
+            'dim': int(dim),
+            'dtype': dtype,
+            'count': 0,
+            'text_bytes': 0,
+            'meta_bytes': 0,
+            'fingerprint': hashlib.sha256(f"{int(dim)}:{dtype}".encode('utf-8')).hexdigest(),
+            'history': [],
+        }
+        cls._write_header(path, header)
+        return cls(path)
+
+    @classmethod
+    def exists(cls, path):
+        return os.path.exists(os.path.join(path, HEADER))
+
+    @classmethod
+    def from_json(cls, json_path, path, dtype='float32', batch_size=1024):
+        """Convert a legacy JSON embeddings file (list of text/embedding/pdf/chunk_id dicts)"""
+        print(f"INFO: Converting legacy embeddings {json_path} -> {path}")
+        with open(json_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        data = [item for item in data if 'embedding' in item and 'text' in item]
+        if not data:
+            raise ValueError(f"No valid embeddings found in {json_path}")
+        store = cls.create(path, len(data[0]['embedding']), dtype)
+        for i in range(0, len(data), batch_size):
+            batch = data[i:i+batch_size]
+            store.append(
+                [item['embedding'] for item in batch],
+                [item['text'] for item in batch],
+                [{'pdf': item.get('pdf'), 'chunk_id': item.get('chunk_id')} for item in batch]
+            )
+        print(f"SUCCESS: Converted {len(store)} embeddings")
+        return store
+
+    @staticmethod
+    def _write_header(path, header):
+        tmp_path = os.path.join(path, HEADER + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(header, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(path, HEADER))
+
+    def __len__(self):
+        return self.header['count']
+
+    @property
+    def fingerprint(self):
+        return self.header.get('fingerprint')
+
+    def has_prefix(self, count, fingerprint):
+        """True when the first `count` rows are exactly the rows that produced `fingerprint`"""
+        if count == 0:
+            return True
+        return [count, fingerprint] in self.header.get('history', [])
+
+    @property
+    def row_bytes(self):
+        return self.dim * np.dtype(self.dtype).itemsize
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _truncate_uncommitted(self):
+        count = self.header['count']
+        committed = {
+            VECTORS: count * self.row_bytes,
+            TEXTS: self.header['text_bytes'],
+            META: self.header['meta_bytes'],
+        }
+        if self.dtype == 'int8':
+            committed[SCALES] = count * 4
+        for name, size in committed.items():
+            path = self._file(name)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                with open(path, 'r+b') as f:
+                    f.truncate(size)
+
+    def append(self, embeddings, texts, metas):
+        """Append rows; each meta dict is stored alongside the text offset/length"""
+        matrix = normalize_rows(embeddings)
+        if matrix.ndim != 2 or matrix.shape[1] != self.dim:
+            raise ValueError(f"Expected embeddings of dimension {self.dim}, got shape {matrix.shape}")
+        if not (len(matrix) == len(texts) == len(metas)):
+            raise ValueError("embeddings, texts and metas must have the same length")
+        if len(matrix) == 0:
+            return
+
+        scales = None
+        if self.dtype == 'int8':
+            scales = np.abs(matrix).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            rows = np.round(matrix / scales[:, None]).astype(np.int8)
+            scales = scales.astype(np.float32)
+        else:
+            rows = matrix.astype(self.dtype)
+        self._append_rows(rows, scales, texts, metas)
+
+    def _append_rows(self, rows, scales, texts, metas):
+        """Append already encoded rows (and int8 scales) with their texts and metadata"""
+        self._truncate_uncommitted()
+
+        fingerprint = hashlib.sha256(self.header.get('fingerprint', '').encode('utf-8'))
+        if self.dtype == 'int8':
+            scale_bytes = np.ascontiguousarray(scales, dtype=np.float32).tobytes()
+            fingerprint.update(scale_bytes)
+            with open(self._file(SCALES), 'ab') as f:
+                f.write(scale_bytes)
+        row_bytes = np.ascontiguousarray(rows, dtype=self.dtype).tobytes()
+        fingerprint.update(row_bytes)
+        with open(self._file(VECTORS), 'ab') as f:
+            f.write(row_bytes)
+
+        offset = self.header['text_bytes']
+        meta_lines = []
+        with open(self._file(TEXTS), 'ab') as f:
+            for text, meta in zip(texts, metas):
+                encoded = text.encode('utf-8')
+                f.write(encoded)
+                meta = {key: value for key, value in meta.items() if key not in ('offset', 'length')}
+                meta_lines.append(json.dumps(dict(meta, offset=offset, length=len(encoded)), ensure_ascii=False) + '\n')
+                offset += len(encoded)
+        meta_blob = ''.join(meta_lines).encode('utf-8')
+        with open(self._file(META), 'ab') as f:
+            f.write(meta_blob)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.header['count'] += len(rows)
+        self.header['text_bytes'] = offset
+        self.header['meta_bytes'] += len(meta_blob)
+        self.header['fingerprint'] = fingerprint.hexdigest()
+        self.header.setdefault('history', []).append([self.header['count'], self.header['fingerprint']])
+        self._write_header(self.path, self.header)
+        self._meta = None
+        self._texts = None
+
+    def _encoded(self, rows):
+        """Encoded rows, int8 scales and texts of the given row indices, ready for _append_rows"""
+        rows = np.asarray(rows, dtype=np.int64)
+        raw = np.array(self.raw_vectors()[rows])
+        scales = None
+        if self.dtype == 'int8':
+            scales = np.fromfile(self._file(SCALES), dtype=np.float32, count=len(self))[rows]
+        texts = self.texts()
+        return raw, scales, [texts[r] for r in rows]
+
+    def copy_rows(self, rows, metas):
+        """Append copies of existing rows under new metadata, without re-encoding the vectors"""
+        if len(rows) != len(metas):
+            raise ValueError("rows and metas must have the same length")
+        if len(rows):
+            self._append_rows(*self._encoded(rows), metas)
+
+    def compact(self, keep_rows, metas, batch_size=4096):
+        """
+        Rewrite the store with only `keep_rows` (in that order) and new meta dicts,
+        copying encoded rows as-is. Returns the reopened store; its fingerprint
+        history restarts, so persisted indexes are rebuilt.
+        """
+        keep_rows = np.asarray(keep_rows, dtype=np.int64)
+        if len(keep_rows) != len(metas):
+            raise ValueError("keep_rows and metas must have the same length")
+        tmp_path = self.path.rstrip(os.sep) + '.compact'
+        old_path = self.path.rstrip(os.sep) + '.old'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+        compacted = EmbeddingStore.create(tmp_path, self.dim, self.dtype)
+        for i in range(0, len(keep_rows), batch_size):
+            compacted._append_rows(*self._encoded(keep_rows[i:i+batch_size]), metas[i:i+batch_size])
+
+        os.replace(self.path, old_path)
+        os.replace(tmp_path, self.path)
+        shutil.rmtree(old_path, ignore_errors=True)
+        return EmbeddingStore(self.path)
+
+    def raw_vectors(self):
+        """Memory-mapped view of the stored rows, in the on-disk dtype"""
+        if len(self) == 0:
+            return np.zeros((0, self.dim), dtype=self.dtype)
+        return np.memmap(self._file(VECTORS), dtype=self.dtype, mode='r', shape=(len(self), self.dim))
+
+    def vectors(self):
+        """Unit-norm float32 matrix; zero-copy memmap for float32 stores"""
+        raw = self.raw_vectors()
+        if self.dtype == 'float32':
+            return raw
+        matrix = np.asarray(raw, dtype=np.float32)
+        if self.dtype == 'int8':
+            scales = np.fromfile(self._file(SCALES), dtype=np.float32, count=len(self))
+            matrix *= scales[:, None]
+        return matrix
+
+    def meta(self):
+        if self._meta is None:
+            self._meta = []
+            if len(self):
+                with open(self._file(META), 'rb') as f:
+                    blob = f.read(self.header['meta_bytes'])
+                self._meta = [json.loads(line) for line in blob.decode('utf-8').splitlines()]
+        return self._meta
+
+    def texts(self):
+        if self._texts is None:
+            self._texts = []
+            if len(self):
+                with open(self._file(TEXTS), 'rb') as f:
+                    blob = f.read(self.header['text_bytes'])
+                self._texts = [
+                    blob[m['offset']:m['offset'] + m['length']].decode('utf-8') for m in self.meta()
+                ]
+        return self._texts
+
+    def text(self, i):
+        return self.texts()[i]
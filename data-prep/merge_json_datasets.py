@@ -1,63 +1,401 @@
+"""
+Merge every prepared dataset under json/ into the final training set.
+
+Sources are streamed record by record (the JSONL checkpoint a prepare script
+leaves next to its output when there is one, otherwise the JSON array parsed
+incrementally), so memory stays bounded however large the sources grow. The
+seeded shuffle is external: records are first spilled into randomly chosen
+bucket files, then each bucket is shuffled in memory and written out as
+zstd-compressed Parquet shards of at most --shard-mb with a fixed
+input/context/output/source schema. Near-duplicates across sources are dropped
+on the way in (near_dedup.py), keeping the first occurrence in source order.
+
+Next to the shards, index.json lists every shard with its record count and
+size, and the dataset card's YAML header (README.md) gets the `configs` and
+`dataset_info` entries that let `load_dataset` read the Parquet files directly.
+"""
 import os
 import json
+import math
 import random
-from huggingface_hub import HfApi
+import shutil
+import argparse
+import tempfile
+from collections import Counter
+import pyarrow as pa
+import pyarrow.parquet as pq
+from huggingface_hub import DatasetCard, HfApi
 from dotenv import load_dotenv
+from checkpoint import checkpoint_path_for
+from near_dedup import NearDuplicateIndex, INDEX_PATH, THRESHOLD, drop_near_duplicates, print_report
 
 load_dotenv()
 
 DIR_PATH = 'json'
-OUT_PATH = 'json/final/medical_training_dataset.json'
+OUT_DIR = 'json/final'
+SHARD_SUBDIR = 'data'
 EXCLUDE = {'pdf_embeddings.json'}
 HUGGING_FACE_TOKEN = os.getenv("HUGGING_FACE_TOKEN")
+REPO_ID = "ericrisco/medical-training-dataset"
+# Single-file output written by earlier versions of this script
+LEGACY_OUTPUT = 'medical_training_dataset.json'
+INDEX_FILE = 'index.json'
+CARD_FILE = 'README.md'
+
+SCHEMA = pa.schema([
+    pa.field('input', pa.string(), nullable=False),
+    pa.field('context', pa.string(), nullable=False),
+    pa.field('output', pa.string(), nullable=False),
+    pa.field('source', pa.string(), nullable=False),
+])
+COMPRESSION = 'zstd'
+COMPRESSION_LEVEL = 9
+# Records per Parquet row group; a shard can overshoot --shard-mb by at most one group
+ROW_GROUP_ROWS = 10000
+
+READ_CHUNK = 1024 * 1024
+BUCKET_MB = 64
+SHARD_MB = 256
+SEED = 42
+
+
+def iter_json_array(path, chunk_size=READ_CHUNK):
+    """Yield the items of a JSON array file (or the file's single object) without loading it whole"""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buf, pos = f.read(chunk_size), 0
+
+        def fill():
+            nonlocal buf, pos
+            more = f.read(chunk_size)
+            buf, pos = buf[pos:] + more, 0
+            return bool(more)
+
+        def skip_whitespace():
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in ' \t\r\n':
+                    pos += 1
+                if pos < len(buf) or not fill():
+                    return pos < len(buf)
+
+        if not skip_whitespace():
+            return
+        if buf[pos] == '{':
+            yield json.loads(buf[pos:] + f.read())
+            return
+        if buf[pos] != '[':
+            raise ValueError(f"Expected a JSON array or object in {path}")
+        pos += 1
+
+        while True:
+            if not skip_whitespace():
+                raise ValueError(f"Unterminated JSON array in {path}")
+            if buf[pos] == ']':
+                return
+            if buf[pos] == ',':
+                pos += 1
+                continue
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # The item runs past the buffer; read more and retry
+                if not fill():
+                    raise
+                continue
+            yield item
+            pos = end
+
 
-all_data = []
+def iter_jsonl(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # A torn last line from an interrupted write; drop it
+                continue
 
-for fname in os.listdir(DIR_PATH):
-    if not fname.endswith('.json') or fname in EXCLUDE:
-        continue
-    fpath = os.path.join(DIR_PATH, fname)
-    with open(fpath, 'r') as f:
+
+def list_sources(dir_path=DIR_PATH):
+    """Map source name -> file to read, preferring a prepare script's JSONL checkpoint"""
+    sources = {}
+    for fname in sorted(os.listdir(dir_path)):
+        if not fname.endswith('.json') or fname in EXCLUDE:
+            continue
+        json_path = os.path.join(dir_path, fname)
+        jsonl_path = checkpoint_path_for(json_path)
+        sources[os.path.splitext(fname)[0]] = jsonl_path if os.path.exists(jsonl_path) else json_path
+    return sources
+
+
+def iter_source(path):
+    return iter_jsonl(path) if path.endswith('.jsonl') else iter_json_array(path)
+
+
+def iter_records(sources, counts):
+    """Yield every record tagged with its source; `counts` collects records per source"""
+    for source, path in sources.items():
+        counts[source] = 0
         try:
-            data = json.load(f)
+            for entry in iter_source(path):
+                if not isinstance(entry, dict):
+                    continue
+                entry['source'] = source
+                counts[source] += 1
+                yield entry
         except Exception as e:
-            print(f"Error loading {fname}: {e}")
+            print(f"ERROR: Failed reading {path} after {counts[source]} records: {e}")
             continue
+        print(f"INFO: Read {counts[source]} records from {path}")
+
+
+def spill_to_buckets(records, tmp_dir, num_buckets, rng):
+    """First shuffle pass: send each record to a random bucket file"""
+    paths = [os.path.join(tmp_dir, f'bucket-{i:05d}.jsonl') for i in range(num_buckets)]
+    files = [open(p, 'w', encoding='utf-8') for p in paths]
+    try:
+        for record in records:
+            files[rng.randrange(num_buckets)].write(json.dumps(record, ensure_ascii=False) + '\n')
+    finally:
+        for f in files:
+            f.close()
+    return paths
+
+
+def to_row(record):
+    """Fit a record to SCHEMA: missing or null fields become '', extra keys are dropped"""
+    return {name: '' if record.get(name) is None else str(record[name]) for name in SCHEMA.names}
+
+
+def write_shuffled_shards(bucket_paths, shard_dir, shard_bytes, rng, compression=COMPRESSION):
+    """
+    Second pass: shuffle each bucket in memory and stream it into size-bounded
+    Parquet shards. Returns (total records, shard entries for index.json).
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    for fname in os.listdir(shard_dir):
+        # Earlier runs may have left JSONL shards or a different shard count behind
+        if fname.startswith('train-'):
+            os.remove(os.path.join(shard_dir, fname))
+
+    shards, pending = [], []
+    writer, out = None, None
+
+    def close_shard():
+        nonlocal writer, out
+        writer.close()
+        out.close()
+        shards[-1]['num_bytes'] = os.path.getsize(shards[-1]['path'])
+        writer, out = None, None
+
+    def flush():
+        nonlocal writer, out
+        if not pending:
+            return
+        if writer is None:
+            shards.append({'path': os.path.join(shard_dir, f'train-{len(shards):05d}.parquet.tmp'),
+                           'num_records': 0, 'sources': Counter()})
+            out = open(shards[-1]['path'], 'wb')
+            writer = pq.ParquetWriter(out, SCHEMA, compression=compression,
+                                      compression_level=COMPRESSION_LEVEL if compression == 'zstd' else None)
+        table = pa.Table.from_pylist(pending, schema=SCHEMA)
+        writer.write_table(table, row_group_size=len(pending))
+        shards[-1]['num_records'] += len(pending)
+        shards[-1]['sources'].update(row['source'] for row in pending)
+        shards[-1]['uncompressed_bytes'] = shards[-1].get('uncompressed_bytes', 0) + table.nbytes
+        pending.clear()
+        if out.tell() >= shard_bytes:
+            close_shard()
+
+    total = 0
+    for bucket_path in bucket_paths:
+        with open(bucket_path, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+        rng.shuffle(lines)
+        for line in lines:
+            pending.append(to_row(json.loads(line)))
+            total += 1
+            if len(pending) >= ROW_GROUP_ROWS:
+                flush()
+        os.remove(bucket_path)
+    flush()
+    if writer is not None:
+        close_shard()
+
+    # Names follow the Hub convention so `load_dataset` picks every shard up as the train split
+    for i, shard in enumerate(shards):
+        final = os.path.join(shard_dir, f'train-{i:05d}-of-{len(shards):05d}.parquet')
+        os.replace(shard['path'], final)
+        shard['path'] = final
+    return total, shards
+
+
+def size_category(n):
+    """The Hub's size_categories bucket for n records"""
+    for limit, label in ((1_000, 'n<1K'), (10_000, '1K<n<10K'), (100_000, '10K<n<100K'),
+                         (1_000_000, '100K<n<1M'), (10_000_000, '1M<n<10M')):
+        if n < limit:
+            return label
+    return 'n>10M'
+
+
+def write_index(out_dir, shards, seed, compression=COMPRESSION):
+    """Describe the shards in index.json; returns the index"""
+    sources = Counter()
+    for shard in shards:
+        sources.update(shard['sources'])
+    index = {
+        'format': 'parquet',
+        'compression': compression,
+        'schema': {field.name: str(field.type) for field in SCHEMA},
+        'seed': seed,
+        'num_records': sum(shard['num_records'] for shard in shards),
+        'num_bytes': sum(shard['num_bytes'] for shard in shards),
+        'uncompressed_bytes': sum(shard['uncompressed_bytes'] for shard in shards),
+        'sources': dict(sorted(sources.items())),
+        'shards': [
+            {
+                'path': os.path.relpath(shard['path'], out_dir).replace(os.sep, '/'),
+                'num_records': shard['num_records'],
+                'num_bytes': shard['num_bytes'],
+            }
+            for shard in shards
+        ],
+    }
+    tmp_path = os.path.join(out_dir, INDEX_FILE + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, os.path.join(out_dir, INDEX_FILE))
+    return index
+
+
+def update_card(out_dir, index):
+    """Point the dataset card's YAML header at the Parquet shards, keeping the rest of the card"""
+    card_path = os.path.join(out_dir, CARD_FILE)
+    if os.path.exists(card_path):
+        card = DatasetCard.load(card_path)
+    else:
+        card = DatasetCard(f"---\n{{}}\n---\n\n# {REPO_ID}\n")
+    card.data.configs = [{
+        'config_name': 'default',
+        'data_files': [{'split': 'train', 'path': f'{SHARD_SUBDIR}/train-*.parquet'}],
+    }]
+    card.data.dataset_info = {
+        'features': [{'name': field.name, 'dtype': 'string'} for field in SCHEMA],
+        'splits': [{'name': 'train', 'num_bytes': index['uncompressed_bytes'], 'num_examples': index['num_records']}],
+        'download_size': index['num_bytes'],
+        'dataset_size': index['uncompressed_bytes'],
+    }
+    card.data.size_categories = [size_category(index['num_records'])]
+    card.save(card_path)
+
+
+def merge(dir_path=DIR_PATH, out_dir=OUT_DIR, seed=SEED, bucket_mb=BUCKET_MB, shard_mb=SHARD_MB,
+          dedup_threshold=THRESHOLD, dedup_fields=('input',), dedup_index=INDEX_PATH, compression=COMPRESSION):
+    """Merge, dedup and shuffle every source into shards; dedup_threshold=None disables dedup"""
+    sources = list_sources(dir_path)
+    if not sources:
+        print(f"WARNING: No JSON datasets found in {dir_path}")
+        return 0, []
+
+    # Buckets are sized from the input so each one fits comfortably in memory for the second pass
+    input_bytes = sum(os.path.getsize(path) for path in sources.values())
+    num_buckets = max(1, math.ceil(input_bytes / (bucket_mb * 1024 * 1024)))
+    print(f"INFO: Merging {len(sources)} sources ({input_bytes / (1024 * 1024):.1f} MB) through {num_buckets} shuffle buckets")
+
+    rng = random.Random(seed)
+    counts = {}
+    os.makedirs(out_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='merge-', dir=out_dir)
+    index = None
+    report = Counter()
+    try:
+        records = iter_records(sources, counts)
+        if dedup_threshold is not None:
+            index = NearDuplicateIndex(dedup_index, threshold=dedup_threshold)
+            records = drop_near_duplicates(records, index, dedup_fields, report)
+        bucket_paths = spill_to_buckets(records, tmp_dir, num_buckets, rng)
+        total, shards = write_shuffled_shards(
+            bucket_paths, os.path.join(out_dir, SHARD_SUBDIR), shard_mb * 1024 * 1024, rng, compression
+        )
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if index is not None:
+            index.close()
+
+    # The shards replace the single JSON file; keeping both would duplicate every record on the Hub
+    legacy_path = os.path.join(out_dir, LEGACY_OUTPUT)
+    if os.path.exists(legacy_path):
+        os.remove(legacy_path)
+    index_data = write_index(out_dir, shards, seed, compression)
+    update_card(out_dir, index_data)
+
+    print(f"\n=== Records per source ===")
+    for source, count in counts.items():
+        print(f"  - {source}: {count}")
+    if index is not None:
+        print_report(report, counts, index)
+    print(f"Saved {total} records to {len(shards)} {compression} Parquet shards in {os.path.join(out_dir, SHARD_SUBDIR)} "
+          f"({index_data['num_bytes'] / (1024 * 1024):.1f} MB, {index_data['uncompressed_bytes'] / (1024 * 1024):.1f} MB uncompressed)")
+    return total, shards
+
 
-    # If the file contains a list of records, add each with its source
-    if isinstance(data, list):
-        for entry in data:
-            entry['source'] = os.path.splitext(fname)[0]
-            all_data.append(entry)
+def upload(out_dir=OUT_DIR, repo_id=REPO_ID):
+    if not HUGGING_FACE_TOKEN:
+        print("ERROR: Set HUGGING_FACE_TOKEN to upload the dataset")
+        return
 
-    # If the file contains a single record (dict), add it with its source
-    elif isinstance(data, dict):
-        data['source'] = os.path.splitext(fname)[0]
-        all_data.append(data)
+    print(f"Uploading to Hugging Face Hub: {repo_id}")
 
-# Shuffle the dataset to randomize the 'source' order
-random.shuffle(all_data)
+    api = HfApi(token=HUGGING_FACE_TOKEN)
 
-# Ensure output directory exists
-os.makedirs(os.path.dirname(OUT_PATH), exist_ok=True)
+    api.create_repo(
+        repo_id=repo_id,
+        repo_type="dataset",
+        exist_ok=True,
+        private=False
+    )
+    api.upload_folder(
+        folder_path=out_dir,
+        repo_id=repo_id,
+        repo_type="dataset",
+        # Drop the old single-file export and shards from a previous, differently sharded run
+        delete_patterns=[LEGACY_OUTPUT, f"{SHARD_SUBDIR}/*"],
+    )
 
-with open(OUT_PATH, 'w') as f:
-    json.dump(all_data, f, indent=2, ensure_ascii=False)
 
-print(f"Saved {len(all_data)} records to {OUT_PATH}")
+def main():
+    parser = argparse.ArgumentParser(description="Merge prepared datasets into shuffled Parquet shards and upload them")
+    parser.add_argument("--input-dir", default=DIR_PATH, help="Directory with the prepared JSON datasets")
+    parser.add_argument("--output-dir", default=OUT_DIR, help="Dataset folder (shards go to <output-dir>/data)")
+    parser.add_argument("--seed", type=int, default=SEED, help="Shuffle seed")
+    parser.add_argument("--bucket-mb", type=int, default=BUCKET_MB,
+                       help="Target size of a shuffle bucket; bounds memory use of the second pass")
+    parser.add_argument("--shard-mb", type=int, default=SHARD_MB, help="Maximum (compressed) size of an output shard")
+    parser.add_argument("--compression", choices=["zstd", "snappy", "gzip", "none"], default=COMPRESSION,
+                       help="Parquet compression codec")
+    parser.add_argument("--dedup-threshold", type=float, default=THRESHOLD,
+                       help="Estimated Jaccard similarity at which a record counts as a near-duplicate")
+    parser.add_argument("--dedup-fields", nargs="+", choices=["input", "output"], default=["input"],
+                       help="Record fields compared for near-duplicates")
+    parser.add_argument("--dedup-index", default=INDEX_PATH,
+                       help="SQLite file persisting MinHash signatures between merges")
+    parser.add_argument("--no-dedup", action="store_true", help="Skip near-duplicate removal")
+    parser.add_argument("--no-upload", action="store_true", help="Only write the shards locally")
+    args = parser.parse_args()
 
-print(f"Uploading to Hugging Face Hub: " + HUGGING_FACE_TOKEN)
+    total, _ = merge(
+        args.input_dir, args.output_dir, args.seed, args.bucket_mb, args.shard_mb,
+        dedup_threshold=None if args.no_dedup else args.dedup_threshold,
+        dedup_fields=tuple(args.dedup_fields), dedup_index=args.dedup_index, compression=args.compression
+    )
+    if total and not args.no_upload:
+        upload(args.output_dir)
 
-api = HfApi(token=HUGGING_FACE_TOKEN)
 
-api.create_repo(
-    repo_id="ericrisco/medical-training-dataset",
-    repo_type="dataset",
-    exist_ok=True,
-    private=False
-)
-api.upload_folder(
-    folder_path=os.path.dirname(OUT_PATH),
-    repo_id="ericrisco/medical-training-dataset",
-    repo_type="dataset",
-) 
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Cross-source near-duplicate detection with MinHash and LSH banding.
+
+Each record's text (input, optionally joined with output) is lowercased,
+tokenized into words and shingled into word n-grams. A MinHash signature of
+NUM_PERM multiply-shift hashes estimates the Jaccard similarity of two shingle
+sets, and LSH splits the signature into bands so only records sharing a band
+bucket are compared: one indexed lookup per record, near-linear overall.
+
+Records are kept in stream order; a record whose estimated Jaccard similarity
+with an already kept record reaches the threshold is dropped. Signatures are
+persisted in SQLite keyed by a hash of the normalized text, so an incremental
+merge only computes MinHash for new or changed texts. The kept set and its band
+buckets are rebuilt on every run, so removing a source never leaves stale
+records shadowing new ones.
+"""
+import os
+import re
+import json
+import zlib
+import sqlite3
+import hashlib
+from collections import Counter
+import numpy as np
+
+NUM_PERM = 128
+NGRAM = 3
+THRESHOLD = 0.8
+SEED = 1
+INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'minhash_index.sqlite')
+COMMIT_EVERY = 5000
+
+
+def optimal_bands(threshold, num_perm):
+    """(bands, rows) minimizing the false positive + false negative area around the threshold"""
+    below = np.linspace(0.0, threshold, 200)
+    above = np.linspace(threshold, 1.0, 200)
+    best = None
+    for bands in range(1, num_perm + 1):
+        rows = num_perm // bands
+        collide = lambda s: 1.0 - (1.0 - s ** rows) ** bands
+        error = collide(below).mean() * threshold + (1.0 - collide(above)).mean() * (1.0 - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+def normalize(text):
+    return re.findall(r'\w+', (text or '').lower())
+
+
+class MinHasher:
+    def __init__(self, num_perm=NUM_PERM, ngram=NGRAM, seed=SEED):
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hashing: (a * x + b) mod 2^64, top 32 bits, with odd a
+        self.a = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+        self.ngram = ngram
+
+    def shingles(self, words):
+        if len(words) <= self.ngram:
+            return {' '.join(words)}
+        return {' '.join(words[i:i + self.ngram]) for i in range(len(words) - self.ngram + 1)}
+
+    def signature(self, words):
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode('utf-8')) for s in self.shingles(words)), dtype=np.uint64
+        )
+        with np.errstate(over='ignore'):
+            permuted = (hashes[:, None] * self.a + self.b) >> np.uint64(32)
+        return permuted.min(axis=0).astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    def __init__(self, path=INDEX_PATH, threshold=THRESHOLD, num_perm=NUM_PERM, ngram=NGRAM):
+        self.path = path
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands, self.rows = optimal_bands(threshold, num_perm)
+        self.hasher = MinHasher(num_perm, ngram)
+        self.computed = 0
+        self.reused = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS signatures ('
+            ' rid INTEGER PRIMARY KEY,'
+            ' text_hash TEXT UNIQUE NOT NULL,'
+            ' sig BLOB NOT NULL,'
+            ' seen INTEGER NOT NULL)'
+        )
+        # Signatures only stay valid for the hashing parameters that produced them
+        settings = json.dumps({'num_perm': num_perm, 'ngram': ngram, 'seed': SEED})
+        row = self._conn.execute("SELECT value FROM settings WHERE key = 'minhash'").fetchone()
+        if row is None or row[0] != settings:
+            self._conn.execute('DELETE FROM signatures')
+            self._conn.execute("INSERT OR REPLACE INTO settings VALUES ('minhash', ?)", (settings,))
+
+        # Per-run state: kept records and their band buckets
+        self._conn.execute('DROP TABLE IF EXISTS kept')
+        self._conn.execute('DROP TABLE IF EXISTS buckets')
+        self._conn.execute('CREATE TABLE kept (rid INTEGER PRIMARY KEY, source TEXT NOT NULL)')
+        self._conn.execute('CREATE TABLE buckets (h INTEGER NOT NULL, rid INTEGER NOT NULL)')
+        self._conn.execute('CREATE INDEX buckets_h ON buckets(h)')
+        self._conn.execute('UPDATE signatures SET seen = 0')
+        self._conn.commit()
+        self._pending = 0
+
+    def _signature(self, words):
+        text_hash = hashlib.sha1(' '.join(words).encode('utf-8')).hexdigest()
+        row = self._conn.execute('SELECT rid, sig FROM signatures WHERE text_hash = ?', (text_hash,)).fetchone()
+        if row is not None:
+            self.reused += 1
+            self._conn.execute('UPDATE signatures SET seen = 1 WHERE rid = ?', (row[0],))
+            return row[0], np.frombuffer(row[1], dtype=np.uint32)
+        self.computed += 1
+        sig = self.hasher.signature(words)
+        cursor = self._conn.execute(
+            'INSERT INTO signatures (text_hash, sig, seen) VALUES (?, ?, 1)', (text_hash, sig.tobytes())
+        )
+        return cursor.lastrowid, sig
+
+    def _band_hashes(self, sig):
+        return [
+            int.from_bytes(hashlib.blake2b(
+                bytes([band]) + sig[band * self.rows:(band + 1) * self.rows].tobytes(), digest_size=8
+            ).digest(), 'little', signed=True)
+            for band in range(self.bands)
+        ]
+
+    def check(self, text, source):
+        """
+        Return None when the text is new (it is then kept), or the source of the
+        kept record it nearly duplicates. Texts without words are always kept.
+        """
+        words = normalize(text)
+        if not words:
+            return None
+        rid, sig = self._signature(words)
+
+        row = self._conn.execute('SELECT source FROM kept WHERE rid = ?', (rid,)).fetchone()
+        if row is not None:
+            return row[0]
+
+        hashes = self._band_hashes(sig)
+        candidates = self._conn.execute(
+            'SELECT DISTINCT s.sig, k.source FROM buckets b'
+            ' JOIN signatures s ON s.rid = b.rid JOIN kept k ON k.rid = b.rid'
+            f' WHERE b.h IN ({",".join("?" * len(hashes))})', hashes
+        ).fetchall()
+        for candidate_sig, candidate_source in candidates:
+            if np.mean(np.frombuffer(candidate_sig, dtype=np.uint32) == sig) >= self.threshold:
+                return candidate_source
+
+        self._conn.execute('INSERT INTO kept (rid, source) VALUES (?, ?)', (rid, source))
+        self._conn.executemany('INSERT INTO buckets (h, rid) VALUES (?, ?)', [(h, rid) for h in hashes])
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self._conn.commit()
+            self._pending = 0
+        return None
+
+    def close(self):
+        """Forget signatures of texts that are no longer in any source, then persist the index"""
+        self._conn.execute('DELETE FROM signatures WHERE seen = 0')
+        self._conn.execute('DROP TABLE kept')
+        self._conn.execute('DROP TABLE buckets')
+        self._conn.commit()
+        self._conn.close()
+
+
+def dedup_text(record, fields):
+    return '\n'.join(str(record.get(field) or '') for field in fields)
+
+
+def drop_near_duplicates(records, index, fields=('input',), report=None):
+    """
+    Yield records that are not near-duplicates of an earlier one. `report`
+    (a Counter) collects (removed source, kept source) pairs.
+    """
+    for record in records:
+        kept_source = index.check(dedup_text(record, fields), record.get('source'))
+        if kept_source is None:
+            yield record
+        elif report is not None:
+            report[(record.get('source'), kept_source)] += 1
+
+
+def print_report(report, counts, index):
+    removed = Counter()
+    for (source, _), n in report.items():
+        removed[source] += n
+    print(f"\n=== Near-duplicates removed (Jaccard >= {index.threshold}, {index.bands} bands x {index.rows} rows) ===")
+    print(f"MinHash signatures computed: {index.computed}, reused from {index.path}: {index.reused}")
+    for source, count in counts.items():
+        if not removed[source]:
+            continue
+        matches = ', '.join(f"{kept} {n}" for (s, kept), n in report.most_common() if s == source)
+        print(f"  - {source}: {removed[source]} of {count} ({removed[source] / count:.1%}) duplicate {matches}")
+    print(f"Total removed: {sum(removed.values())}")
@@ -0,0 +1,151 @@
+"""
+Parallel PDF text extraction with a per-page cache.
+
+PDFs are parsed in a process pool; large PDFs are split into page ranges so one
+300-page handbook does not serialize the whole run. Every extracted page is
+cached as `<cache_dir>/<sha256 of the PDF>/<page>.txt`, so re-running after
+adding a PDF only parses the new file. Pages that fail to extract are not
+cached and are retried on the next run.
+"""
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import PyPDF2
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'pdf_text')
+PAGES_PER_TASK = 50
+
+
+def file_sha256(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _open_reader(f, pdf_name):
+    try:
+        reader = PyPDF2.PdfReader(f)
+
+        # Check if PDF is encrypted
+        if reader.is_encrypted:
+            # Try to decrypt with empty password
+            if not reader.decrypt(''):
+                raise ValueError(f"Could not decrypt encrypted PDF: {pdf_name}")
+        return reader
+    except PyPDF2.errors.PdfReadError as pdf_error:
+        raise ValueError(f"PyPDF2 could not read PDF {pdf_name}: {pdf_error}")
+
+
+def _page_path(cache_dir, sha, page_num):
+    return os.path.join(cache_dir, sha, f'{page_num:05d}.txt')
+
+
+def _count_pages(pdf_path, sha, cache_dir):
+    """Number of pages, remembered in the cache so unchanged PDFs are never opened again"""
+    info_path = os.path.join(cache_dir, sha, 'pages.json')
+    if os.path.exists(info_path):
+        with open(info_path, 'r', encoding='utf-8') as f:
+            return json.load(f)['pages']
+
+    pdf_name = os.path.basename(pdf_path)
+    with open(pdf_path, 'rb') as f:
+        reader = _open_reader(f, pdf_name)
+        pages = len(reader.pages)
+    if pages == 0:
+        raise ValueError(f"PDF has no pages: {pdf_name}")
+
+    os.makedirs(os.path.dirname(info_path), exist_ok=True)
+    with open(info_path, 'w', encoding='utf-8') as f:
+        json.dump({'pages': pages, 'file': pdf_name}, f)
+    return pages
+
+
+def _extract_range(pdf_path, sha, start, end, cache_dir):
+    """Extract pages [start, end) that are not cached yet; returns per-page warnings"""
+    missing = [p for p in range(start, end) if not os.path.exists(_page_path(cache_dir, sha, p))]
+    if not missing:
+        return []
+
+    pdf_name = os.path.basename(pdf_path)
+    warnings = []
+    with open(pdf_path, 'rb') as f:
+        reader = _open_reader(f, pdf_name)
+        for page_num in missing:
+            try:
+                page_text = reader.pages[page_num].extract_text() or ''
+            except Exception as page_error:
+                warnings.append(f"Failed to extract text from page {page_num + 1} of {pdf_name}: {page_error}")
+                continue
+            path = _page_path(cache_dir, sha, page_num)
+            with open(path + '.tmp', 'w', encoding='utf-8') as out:
+                out.write(page_text)
+            os.replace(path + '.tmp', path)
+    return warnings
+
+
+def _assemble(sha, pages, cache_dir):
+    page_texts = []
+    for page_num in range(pages):
+        path = _page_path(cache_dir, sha, page_num)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                page_texts.append(f.read())
+    text = ''.join(page_texts)
+    return text, sum(1 for t in page_texts if t)
+
+
+def extract_pdfs(pdf_paths, workers=None, cache_dir=CACHE_DIR, pages_per_task=PAGES_PER_TASK):
+    """
+    Extract the text of every PDF. Returns {pdf_path: result}, where result is a
+    dict with 'text', 'pages_processed', 'total_pages' and 'sha256', or the
+    exception that made the PDF unreadable.
+    """
+    results = {}
+    hashes = {}
+    for pdf_path in pdf_paths:
+        try:
+            # Check if file exists and is readable
+            if not os.path.exists(pdf_path):
+                raise FileNotFoundError(f"PDF file not found: {pdf_path}")
+            if os.path.getsize(pdf_path) == 0:
+                raise ValueError(f"PDF file is empty: {pdf_path}")
+            hashes[pdf_path] = file_sha256(pdf_path)
+        except Exception as e:
+            results[pdf_path] = e
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        page_counts = {
+            pdf_path: pool.submit(_count_pages, pdf_path, sha, cache_dir)
+            for pdf_path, sha in hashes.items()
+        }
+        range_tasks = {}
+        for pdf_path, future in page_counts.items():
+            try:
+                pages = future.result()
+            except Exception as e:
+                results[pdf_path] = e
+                continue
+            range_tasks[pdf_path] = (pages, [
+                pool.submit(_extract_range, pdf_path, hashes[pdf_path], start, min(start + pages_per_task, pages), cache_dir)
+                for start in range(0, pages, pages_per_task)
+            ])
+
+        for pdf_path, (pages, futures) in range_tasks.items():
+            try:
+                for future in futures:
+                    for warning in future.result():
+                        print(f"WARNING: {warning}")
+            except Exception as e:
+                results[pdf_path] = e
+                continue
+            text, pages_processed = _assemble(hashes[pdf_path], pages, cache_dir)
+            results[pdf_path] = {
+                'text': text,
+                'pages_processed': pages_processed,
+                'total_pages': pages,
+                'sha256': hashes[pdf_path],
+            }
+    return results
@@ -0,0 +1,287 @@
+"""
+Engine behind the prepare_* scripts.
+
+A Source declares where a Hugging Face dataset was downloaded (by
+data/download_all.py), which columns it reads, and how a row becomes an
+{input, context, output} record: format-string or callable templates, plus an
+optional LLM step. The engine finds the cached Arrow files in the HF cache
+layout, reads only the mapped columns in record batches, and writes every
+source through a JsonlCheckpoint exported to json/<name>.json.
+
+Template-only sources are rebuilt from scratch on every run (they are cheap and
+deterministic), column-wise through arrow_transforms.py when every template has
+an Arrow equivalent and row by row otherwise; sources with an LLM step resume from their checkpoint and skip
+inputs they already saved. LLM rows run concurrently through run_concurrently
+and share the on-disk Ollama response cache, so running several sources in one
+process reuses the same client and cache.
+
+    python prepare_engine.py --list
+    python prepare_engine.py medqa diseases_symptoms
+    python prepare_engine.py --all
+"""
+import os
+import glob
+import argparse
+from collections import Counter
+from datasets import Dataset, concatenate_datasets
+from tqdm import tqdm
+from checkpoint import JsonlCheckpoint
+from arrow_transforms import vectorized_table
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT, 'data')
+JSON_DIR = os.path.join(ROOT, 'data-prep', 'json')
+# Rows decoded from Arrow per batch
+BATCH_SIZE = 1000
+RECORD_FIELDS = ('input', 'context', 'output')
+
+SOURCES = {}
+
+
+class Source:
+    """
+    One dataset-to-records adapter.
+
+    fields    variable name -> dataset column; strings are stripped and missing
+              values become ''
+    required  variables that must be non-empty for a row to be used
+    input, context, output
+              format strings over the variables ('{question}') or callables
+              taking the variables dict
+    llm       optional callable (variables, record, seen) -> record or None,
+              run concurrently; `seen` holds the inputs already saved (a
+              returned record whose input is in it counts as a duplicate),
+              and returning None drops the row
+    dedupe    skip rows whose input was already saved
+    vectorized
+              field -> callable taking the variables as Arrow arrays, for
+              template-only sources whose callable templates have a
+              pyarrow.compute equivalent (see arrow_transforms.py)
+    """
+
+    def __init__(self, name, repo_id, folder, fields, input='', context='', output='', required=(),
+                 config='default', split='train', llm=None, dedupe=True, vectorized=None):
+        self.name = name
+        self.repo_id = repo_id
+        self.folder = folder
+        self.fields = fields
+        self.templates = {'input': input, 'context': context, 'output': output}
+        self.required = required
+        self.config = config
+        self.split = split
+        self.llm = llm
+        self.dedupe = dedupe
+        self.vectorized = vectorized or {}
+
+    def __repr__(self):
+        return f"Source({self.name!r}, {self.repo_id!r})"
+
+    def variables(self, batch, i):
+        values = {}
+        for var, column in self.fields.items():
+            value = batch[column][i]
+            if value is None:
+                value = ''
+            elif isinstance(value, str):
+                value = value.strip()
+            values[var] = value
+        return values
+
+    def render(self, values):
+        record = {}
+        for field, template in self.templates.items():
+            text = template(values) if callable(template) else template.format(**values)
+            record[field] = text.strip()
+        return record
+
+
+def register(source):
+    if source.name in SOURCES:
+        raise ValueError(f"Source {source.name} is already registered")
+    SOURCES[source.name] = source
+    return source
+
+
+def load_registry():
+    """Import the adapter definitions, which register themselves"""
+    import prepare_sources  # noqa: F401
+    # Go through the module: run as a script, this file is __main__ and its SOURCES stays empty
+    import prepare_engine
+    return prepare_engine.SOURCES
+
+
+def find_arrow_files(source, data_dir=DATA_DIR):
+    """
+    Arrow files of a source's split in the HF cache that download_all.py
+    populates: <data>/<folder>/<owner>___<name>/<config>/<version>/<hash>/
+    <name>-<split>[-NNNNN-of-NNNNN].arrow. The most recently written snapshot
+    wins, so no commit hash needs to be hardcoded.
+    """
+    cache_name = source.repo_id.replace('/', '___').lower()
+    snapshots = {}
+    for path in glob.glob(os.path.join(data_dir, source.folder, '*', source.config, '*', '*', '*.arrow')):
+        snapshot = os.path.dirname(path)
+        dataset_dir = os.path.relpath(snapshot, os.path.join(data_dir, source.folder)).split(os.sep)[0]
+        stem = os.path.basename(path)[:-len('.arrow')]
+        if dataset_dir.lower() != cache_name:
+            continue
+        if stem.endswith(f'-{source.split}') or f'-{source.split}-' in stem:
+            snapshots.setdefault(snapshot, []).append(path)
+    if not snapshots:
+        raise FileNotFoundError(
+            f"No cached Arrow files for {source.repo_id} ({source.config}/{source.split}) under "
+            f"{os.path.join(data_dir, source.folder)}; run data/download_all.py first"
+        )
+    latest = max(snapshots, key=lambda d: max(os.path.getmtime(p) for p in snapshots[d]))
+    return sorted(snapshots[latest])
+
+
+def load_source_dataset(source, data_dir=DATA_DIR):
+    """Memory-map the source's Arrow files, keeping only the mapped columns"""
+    parts = [Dataset.from_file(path) for path in find_arrow_files(source, data_dir)]
+    ds = parts[0] if len(parts) == 1 else concatenate_datasets(parts)
+    return ds.select_columns(sorted(set(source.fields.values())))
+
+
+def iter_rows(source, ds, batch_size=BATCH_SIZE):
+    """Yield (index, variables) decoding the dataset one record batch at a time"""
+    idx = 0
+    for batch in ds.iter(batch_size=batch_size):
+        for i in range(len(next(iter(batch.values())))):
+            yield idx, source.variables(batch, i)
+            idx += 1
+
+
+def template_records(source, ds, batch_size=BATCH_SIZE, stats=None):
+    """
+    Row-by-row path of a template-only source: yield its records in dataset
+    order, without incomplete rows and (when deduplicating) repeated inputs.
+    """
+    stats = stats if stats is not None else Counter()
+    seen = set()
+    for _, values in iter_rows(source, ds, batch_size):
+        if any(not values[var] for var in source.required):
+            stats['incomplete'] += 1
+            continue
+        record = source.render(values)
+        if not record['input'] or not record['output']:
+            stats['incomplete'] += 1
+            continue
+        if source.dedupe:
+            if record['input'] in seen:
+                stats['duplicates'] += 1
+                continue
+            seen.add(record['input'])
+        yield record
+
+
+def run_source(source, json_dir=JSON_DIR, data_dir=DATA_DIR, batch_size=BATCH_SIZE, concurrency=None,
+               vectorize=True):
+    """Build json/<name>.json for one source; returns the number of records written"""
+    os.makedirs(json_dir, exist_ok=True)
+    output_path = os.path.join(json_dir, f'{source.name}.json')
+    ds = load_source_dataset(source, data_dir)
+    sink = JsonlCheckpoint(output_path)
+    stats = Counter()
+    print(f"INFO: Preparing {source.name} from {source.repo_id} ({len(ds)} rows)")
+
+    if source.llm is None:
+        sink.clear()
+        resumed = 0
+        table = vectorized_table(source, ds.with_format('arrow')[:], stats) if vectorize else None
+        if table is not None:
+            records = table.to_pylist()
+        else:
+            records = template_records(source, ds, batch_size, stats)
+        sink.extend(tqdm(records, unit='record', desc=source.name))
+    else:
+        from run_ollama import OLLAMA_CONCURRENCY, run_concurrently
+        seen = set(record.get('input') for record in sink.load())
+        resumed = sink.count
+
+        def candidates():
+            for idx, values in iter_rows(source, ds, batch_size):
+                if any(not values[var] for var in source.required):
+                    stats['incomplete'] += 1
+                    continue
+                record = source.render(values)
+                # The LLM may fill the input in; only a known input can be checked up front
+                if source.dedupe and record['input'] and record['input'] in seen:
+                    stats['duplicates'] += 1
+                    continue
+                yield idx, values, record
+
+        generate = lambda job: source.llm(job[1], job[2], seen)
+        with tqdm(total=len(ds), unit='row', desc=source.name) as progress:
+            # Rows are generated concurrently (OLLAMA_CONCURRENCY) but saved in dataset order
+            for (idx, _, _), record, error in run_concurrently(generate, candidates(), concurrency or OLLAMA_CONCURRENCY):
+                progress.update(1)
+                if error:
+                    stats['failed'] += 1
+                    print(f"WARNING: Failed row {idx + 1}/{len(ds)} of {source.name}: {error}")
+                    continue
+                # Re-check here: two in-flight rows can produce the same input
+                if record and source.dedupe and record['input'] in seen:
+                    stats['duplicates'] += 1
+                elif not record or not record['input'] or not record['output']:
+                    stats['incomplete'] += 1
+                else:
+                    sink.append({field: record[field] for field in RECORD_FIELDS})
+                    seen.add(record['input'])
+            progress.update(progress.total - progress.n)
+
+    total = sink.export()
+    print(f"SUCCESS: {source.name}: {total} records ({total - resumed} new, {stats['duplicates']} duplicates, "
+          f"{stats['incomplete']} incomplete, {stats['failed']} failed) -> {output_path}")
+    return total
+
+
+def run_sources(names=None, json_dir=JSON_DIR, data_dir=DATA_DIR, batch_size=BATCH_SIZE, concurrency=None,
+                vectorize=True):
+    """Prepare the named sources (every registered source when names is None) in one process"""
+    registry = load_registry()
+    names = list(registry) if names is None else list(names)
+    unknown = [name for name in names if name not in registry]
+    if unknown:
+        raise ValueError(f"Unknown source(s): {', '.join(unknown)} (expected one of {', '.join(registry)})")
+    totals = {}
+    for name in names:
+        try:
+            totals[name] = run_source(registry[name], json_dir, data_dir, batch_size, concurrency, vectorize)
+        except FileNotFoundError as e:
+            print(f"ERROR: {e}")
+    return totals
+
+
+def main():
+    registry = load_registry()
+    parser = argparse.ArgumentParser(description="Prepare training records from the downloaded Hugging Face datasets")
+    parser.add_argument("sources", nargs="*", help=f"Sources to prepare: {', '.join(registry)}")
+    parser.add_argument("--all", action="store_true", help="Prepare every registered source")
+    parser.add_argument("--list", action="store_true", help="List the registered sources and exit")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Directory download_all.py wrote the datasets to")
+    parser.add_argument("--json-dir", default=JSON_DIR, help="Directory for the prepared JSON files")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Rows decoded from Arrow per batch")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="LLM rows in flight (default OLLAMA_CONCURRENCY)")
+    parser.add_argument("--per-row", action="store_true",
+                        help="Build template-only sources row by row instead of with Arrow compute kernels")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, source in registry.items():
+            kind = 'llm' if source.llm else 'template'
+            print(f"{name:32} {source.repo_id:50} {kind}")
+        return
+    if not args.sources and not args.all:
+        parser.error("name at least one source, or pass --all")
+    unknown = [name for name in args.sources if name not in registry]
+    if unknown:
+        parser.error(f"unknown source(s): {', '.join(unknown)}")
+    totals = run_sources(None if args.all else args.sources, args.json_dir, args.data_dir,
+                         args.batch_size, args.concurrency, not args.per_row)
+    print(f"\n=== Prepared {len(totals)} sources: {sum(totals.values())} records ===")
+
+
+if __name__ == "__main__":
+    main()
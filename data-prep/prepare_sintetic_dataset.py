@@ -1,68 +1,50 @@
 import os
 import json
 import numpy as np
-import faiss
 import argparse
 from tqdm import tqdm
-from run_ollama import run_ollama
+from run_ollama import run_ollama, run_concurrently, OLLAMA_CONCURRENCY
+from checkpoint import JsonlCheckpoint, HashIndex
+from embedding_store import EmbeddingStore
+from vector_index import load_index, precompute_neighbors, INDEX_TYPES
 from pathlib import Path
 
-def load_embeddings(embeddings_file):
-    """Load embeddings from JSON file"""
-    print(f"INFO: Loading embeddings from {embeddings_file}")
+def load_embeddings(embeddings_path):
+    """Open the binary embedding store (a legacy JSON file is converted once, next to it)"""
+    print(f"INFO: Loading embeddings from {embeddings_path}")
     
-    if not os.path.exists(embeddings_file):
-        raise FileNotFoundError(f"Embeddings file not found: {embeddings_file}")
+    if EmbeddingStore.exists(embeddings_path):
+        store = EmbeddingStore(embeddings_path)
+    elif embeddings_path.endswith('.json') and os.path.exists(embeddings_path):
+        store_path = embeddings_path[:-len('.json')]
+        if EmbeddingStore.exists(store_path):
+            store = EmbeddingStore(store_path)
+        else:
+            store = EmbeddingStore.from_json(embeddings_path, store_path)
+    else:
+        raise FileNotFoundError(f"Embeddings not found: {embeddings_path}")
     
-    with open(embeddings_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    print(f"SUCCESS: Loaded {len(data)} embeddings")
-    return data
+    print(f"SUCCESS: Loaded {len(store)} embeddings ({store.dtype}, dimension: {store.dim})")
+    return store
 
-def create_faiss_index(embeddings_data):
-    """Create FAISS index from embeddings data"""
-    print("INFO: Creating FAISS vectorstore...")
-    
-    # Extract embeddings and metadata
-    embeddings = []
-    texts = []
-    
-    for item in embeddings_data:
-        if 'embedding' in item and 'text' in item:
-            embeddings.append(item['embedding'])
-            texts.append(item['text'])
-    
-    if not embeddings:
-        raise ValueError("No valid embeddings found in data")
-    
-    # Convert to numpy array
-    embeddings_matrix = np.array(embeddings, dtype=np.float32)
+def create_faiss_index(store, index_type="flat", index_params=None, nprobe=None, ef_search=None):
+    """Load the FAISS index persisted next to the store (built or extended if stale)"""
+    print(f"INFO: Loading {index_type} FAISS vectorstore...")
     
-    # Create FAISS index
-    dimension = embeddings_matrix.shape[1]
-    index = faiss.IndexFlatIP(dimension)  # Inner product for similarity
+    if len(store) == 0:
+        raise ValueError("No valid embeddings found in store")
     
-    # Normalize embeddings for cosine similarity
-    faiss.normalize_L2(embeddings_matrix)
-    index.add(embeddings_matrix)
+    index = load_index(store, index_type, index_params, nprobe=nprobe, ef_search=ef_search)
+    texts = store.texts()
     
-    print(f"SUCCESS: Created FAISS index with {len(embeddings)} vectors (dimension: {dimension})")
+    print(f"SUCCESS: FAISS index ready with {index.ntotal} vectors (dimension: {store.dim})")
     return index, texts
 
-def search_similar_chunks(query_embedding, index, texts, k=5):
-    """Search for similar chunks using FAISS"""
-    # Normalize query embedding
-    query_embedding = np.array([query_embedding], dtype=np.float32)
-    faiss.normalize_L2(query_embedding)
-    
-    # Search
-    scores, indices = index.search(query_embedding, k)
-    
-    # Return results
+def neighbors_to_results(indices, scores, texts):
+    """Turn one row of FAISS ids/scores into ranked search results"""
     results = []
-    for i, (score, idx) in enumerate(zip(scores[0], indices[0])):
-        if idx < len(texts):  # Valid index
+    for i, (score, idx) in enumerate(zip(scores, indices)):
+        if 0 <= idx < len(texts):  # Valid index (approximate indexes pad misses with -1)
             results.append({
                 'text': texts[idx],
                 'score': float(score),
@@ -71,6 +53,11 @@ def search_similar_chunks(query_embedding, index, texts, k=5):
     
     return results
 
+def precompute_chunk_neighbors(store, index, chunk_size, k, config):
+    """Batched search for every chunk's query row (its first embedding), cached on disk"""
+    query_rows = np.arange(0, len(store) - chunk_size + 1, chunk_size)
+    return precompute_neighbors(store, index, query_rows, k, config)
+
 def generate_questions_from_chunks(chunks_text):
     """Generate 3 medical questions from concatenated chunks using Gemma 3N"""
     
@@ -212,7 +199,7 @@ Provide a complete medical answer using this context, or return "null" if insuff
 
     response = run_ollama(
         model="gemma3n",
-        prompt=user_prompt,
+        user_input=user_prompt,
         system_prompt=system_prompt,
         temperature=0.3,  # Lower temperature for more accurate answers
         max_tokens=400
@@ -223,104 +210,226 @@ Provide a complete medical answer using this context, or return "null" if insuff
     
     return response.strip()
 
-def process_embeddings_in_chunks(embeddings_data, index, texts, output_file, chunk_size=5):
+def parse_batched_answers(response, expected):
+    """Parse a JSON array of answers (strings or null); None if it doesn't line up with the questions"""
+    try:
+        # strict=False: answers often contain raw newlines inside the JSON strings
+        answers = json.loads(response.strip(), strict=False)
+    except (json.JSONDecodeError, AttributeError):
+        return None
+    
+    if not isinstance(answers, list) or len(answers) != expected:
+        return None
+    
+    parsed = []
+    for answer in answers:
+        if answer is None:
+            parsed.append(None)
+        elif isinstance(answer, str):
+            answer = answer.strip()
+            parsed.append(None if not answer or answer.lower() == "null" else answer)
+        else:
+            return None
+    return parsed
+
+def answer_each_question(questions, original_context, search_results):
+    """One answer_question_with_context call per question; a failing question gets None"""
+    answers = []
+    for question in questions:
+        try:
+            answers.append(answer_question_with_context(question, original_context, search_results))
+        except Exception as e:
+            print(f"WARNING: Error processing question '{question[:50]}...': {e}")
+            answers.append(None)
+    return answers
+
+def answer_questions_with_context(questions, original_context, search_results):
+    """
+    Answer all questions of a chunk in one call, since they share the same context.
+    Falls back to one answer_question_with_context call per question if the
+    model does not return a well-formed JSON array.
+    """
+    if len(questions) == 1:
+        return answer_each_question(questions, original_context, search_results)
+    
+    # Combine contexts
+    search_context = "\n\n".join([result['text'] for result in search_results])
+    
+    system_prompt = """You are an emergency medicine physician providing clinical guidance.
+
+You will receive several numbered QUESTIONS that share the same medical context.
+
+STRICT REQUIREMENTS:
+1. Answer ONLY medical questions about patient care, treatment, or emergency procedures
+2. Answer a question ONLY if you can provide a complete clinical answer using the provided context
+3. If a question is about documents, training materials, licenses, or administrative topics: its answer is null
+4. If a question cannot be answered with the medical context provided: its answer is null
+5. Provide specific, actionable clinical guidance for healthcare professionals
+6. Include specific steps, dosages, timings, or measurements when available in context
+
+FORBIDDEN TOPICS (always null):
+❌ Document structure, licensing, copyrights
+❌ Training program organization or curriculum
+❌ Administrative or educational metadata
+❌ General advice not based on provided clinical context
+
+REQUIRED TOPICS (provide detailed answers):
+✅ Patient assessment and vital signs
+✅ Treatment protocols and procedures  
+✅ Emergency interventions and medications
+✅ Equipment usage and safety precautions
+✅ Clinical decision-making criteria
+
+Return ONLY a valid JSON array with exactly one element per question, in the same order.
+Each element is either a detailed clinical answer string or null.
+Format: ["Answer to question 1", null, "Answer to question 3"]
+Do not include ```json or ``` in the response."""
+
+    numbered_questions = "\n".join(f"{n}. {question}" for n, question in enumerate(questions, 1))
+    user_prompt = f"""QUESTIONS:
+{numbered_questions}
+
+ORIGINAL CONTEXT:
+{original_context}
+
+ADDITIONAL MEDICAL CONTEXT:
+{search_context}
+
+Return the JSON array of {len(questions)} answers (use null for insufficient information or non-medical questions)."""
+
+    try:
+        response = run_ollama(
+            model="gemma3n",
+            user_input=user_prompt,
+            system_prompt=system_prompt,
+            temperature=0.3,  # Lower temperature for more accurate answers
+            max_tokens=400 * len(questions)
+        )
+    except Exception as e:
+        print(f"WARNING: Batched answer call failed, answering individually: {e}")
+        return answer_each_question(questions, original_context, search_results)
+    
+    answers = parse_batched_answers(response, len(questions))
+    if answers is not None:
+        return answers
+    
+    print(f"WARNING: Failed to parse batched answers, answering individually: {(response or '')[:100]}...")
+    return answer_each_question(questions, original_context, search_results)
+
+def process_embeddings_in_chunks(texts, neighbors, output_file, chunk_size=5, concurrency=OLLAMA_CONCURRENCY):
     
     print(f"INFO: Processing embeddings in chunks of {chunk_size}")
     print(f"INFO: Output file: {output_file}")
     
-    # Load existing data if file exists
-    existing_data = []
-    if os.path.exists(output_file):
-        try:
-            with open(output_file, 'r', encoding='utf-8') as f:
-                existing_data = json.load(f)
-            print(f"INFO: Loaded {len(existing_data)} existing Q&A pairs")
-        except:
-            print("INFO: Starting with empty dataset")
+    # Generated pairs are appended to a JSONL checkpoint; the hash index of their
+    # normalized questions makes both resuming and duplicate checks O(1) per question
+    sink = JsonlCheckpoint(output_file)
+    seen_questions = HashIndex(sink, 'input')
+    if seen_questions.records:
+        print(f"INFO: Loaded {seen_questions.records} existing Q&A pairs")
+    else:
+        print("INFO: Starting with empty dataset")
     
-    total_chunks = len(embeddings_data) // chunk_size
+    total_chunks = len(texts) // chunk_size
+    neighbor_ids, neighbor_scores = neighbors
     successful_generations = 0
     
-    for i in tqdm(range(0, len(embeddings_data), chunk_size), desc="Processing chunks"):
-        chunk = embeddings_data[i:i+chunk_size]
-        
-        if len(chunk) < chunk_size:
-            continue  # Skip incomplete chunks
-        
-        # Concatenate text from chunk
-        chunk_texts = []
-        for item in chunk:
-            if 'text' in item:
-                chunk_texts.append(item['text'])
+    def question_exists(question):
+        # Case, whitespace and punctuation are ignored when comparing questions
+        return question in seen_questions
+    
+    def generate_chunk_qa(i):
+        chunk_texts = texts[i:i+chunk_size]
         
         if len(chunk_texts) < chunk_size:
-            continue
+            return []  # Skip incomplete chunks
         
         concatenated_text = "\n\n".join(chunk_texts)
         
         # Generate questions
         questions = generate_questions_from_chunks(concatenated_text)
         if not questions:
-            continue
+            return []
+        
+        # Similar chunks for the first chunk's embedding, looked up in the precomputed kNN graph
+        search_results = neighbors_to_results(neighbor_ids[i // chunk_size], neighbor_scores[i // chunk_size], texts)
         
-        # Process each question
+        # Skip questions already in the dataset
+        new_questions = []
         for question in questions:
-            try:
-                # Check if this exact question already exists in the dataset
-                question_exists = any(
-                    existing_item.get("input", "").strip() == question.strip() 
-                    for existing_item in existing_data
-                )
-                
-                if question_exists:
-                    print(f"INFO: Skipping duplicate question: {question[:50]}...")
-                    continue
-                
-                # Use first chunk's embedding for similarity search
-                query_embedding = chunk[0]['embedding']
-                
-                # Search for similar chunks
-                search_results = search_similar_chunks(query_embedding, index, texts, k=5)
-                
-                # Generate answer
-                answer = answer_question_with_context(question, concatenated_text, search_results)
-                
-                if answer:  # Only save if we got a valid answer
-                    qa_pair = {
-                        "input": question,
-                        "context": "",  # Keep empty as per original format
-                        "output": answer,
-                        "source": "advanced_firstaid_rag"
-                    }
-                    
-                    existing_data.append(qa_pair)
-                    successful_generations += 1
-                    
-                    # Save incrementally every 10 successful generations
-                    if successful_generations % 10 == 0:
-                        with open(output_file, 'w', encoding='utf-8') as f:
-                            json.dump(existing_data, f, indent=2, ensure_ascii=False)
-                        print(f"INFO: Saved {successful_generations} Q&A pairs")
-                
-            except Exception as e:
-                print(f"WARNING: Error processing question '{question[:50]}...': {e}")
+            if question_exists(question):
+                print(f"INFO: Skipping duplicate question: {question[:50]}...")
                 continue
+            new_questions.append(question)
+        if not new_questions:
+            return []
+        
+        # Answer all questions of the chunk in one call
+        answers = answer_questions_with_context(new_questions, concatenated_text, search_results)
+        
+        qa_pairs = []
+        for question, answer in zip(new_questions, answers):
+            if answer:  # Only save if we got a valid answer
+                qa_pairs.append({
+                    "input": question,
+                    "context": "",  # Keep empty as per original format
+                    "output": answer,
+                    "source": "advanced_firstaid_rag"
+                })
+        return qa_pairs
+    
+    # Chunks are processed concurrently but results are saved in chunk order
+    chunk_starts = range(0, len(texts), chunk_size)
+    results = run_concurrently(generate_chunk_qa, chunk_starts, concurrency=concurrency)
+    for i, qa_pairs, error in tqdm(results, total=len(chunk_starts), desc="Processing chunks"):
+        if error:
+            print(f"WARNING: Error processing chunk {i // chunk_size}: {error}")
+            continue
+        
+        for qa_pair in qa_pairs:
+            # Another in-flight chunk may have produced the same question
+            if question_exists(qa_pair["input"]):
+                print(f"INFO: Skipping duplicate question: {qa_pair['input'][:50]}...")
+                continue
+            
+            sink.append(qa_pair)
+            seen_questions.add(qa_pair["input"])
+            successful_generations += 1
+            
+            if successful_generations % 10 == 0:
+                print(f"INFO: Saved {successful_generations} Q&A pairs")
     
     # Final save
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(existing_data, f, indent=2, ensure_ascii=False)
+    seen_questions.close()
+    total = sink.export()
     
     print(f"SUCCESS: Generated {successful_generations} Q&A pairs")
-    print(f"SUCCESS: Total dataset size: {len(existing_data)} examples")
+    print(f"SUCCESS: Total dataset size: {total} examples")
     print(f"SUCCESS: Saved to: {output_file}")
 
 def main():
     parser = argparse.ArgumentParser(description="Generate advanced first aid Q&A using RAG")
-    parser.add_argument("embeddings_file", help="Path to embeddings JSON file")
+    parser.add_argument("embeddings_file", help="Path to the embedding store directory (or a legacy embeddings JSON file)")
     parser.add_argument("--output", default="/Volumes/EXTERN/DEV/gemma3n-impact-challenge/data-prep/json/advanced_firstaid_qa.json", 
                        help="Output JSON file path")
     parser.add_argument("--chunk_size", type=int, default=5, 
                        help="Number of chunks to process together")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat",
+                       help="FAISS index used for context retrieval (flat is exact)")
+    parser.add_argument("--nlist", type=int, default=None,
+                       help="IVF lists (default: ~4*sqrt(number of vectors))")
+    parser.add_argument("--nprobe", type=int, default=16,
+                       help="IVF lists visited per query")
+    parser.add_argument("--pq-m", type=int, default=None,
+                       help="IVF-PQ sub-quantizers (default: 64)")
+    parser.add_argument("--hnsw-m", type=int, default=None,
+                       help="HNSW neighbors per node (default: 32)")
+    parser.add_argument("--ef-search", type=int, default=64,
+                       help="HNSW candidate list size per query")
+    parser.add_argument("--top-k", type=int, default=5,
+                       help="Similar chunks retrieved as additional answer context")
+    parser.add_argument("--concurrency", type=int, default=OLLAMA_CONCURRENCY,
+                       help="Number of chunk groups generated in parallel against Ollama")
     
     args = parser.parse_args()
     
@@ -328,20 +437,28 @@ def main():
     print(f"INFO: Embeddings file: {args.embeddings_file}")
     print(f"INFO: Output file: {args.output}")
     print(f"INFO: Chunk size: {args.chunk_size}")
+    print(f"INFO: Index type: {args.index_type}")
+    print(f"INFO: Concurrency: {args.concurrency}")
     print("=" * 60)
     
     try:
         # Load embeddings
-        embeddings_data = load_embeddings(args.embeddings_file)
+        store = load_embeddings(args.embeddings_file)
         
         # Create FAISS index
-        index, texts = create_faiss_index(embeddings_data)
+        index_params = {'nlist': args.nlist, 'pq_m': args.pq_m, 'hnsw_m': args.hnsw_m}
+        index, texts = create_faiss_index(store, args.index_type, index_params, args.nprobe, args.ef_search)
+        
+        # Precompute neighbors for all chunks with one batched search
+        search_config = {'index_type': args.index_type, 'index_params': index_params,
+                         'nprobe': args.nprobe, 'ef_search': args.ef_search}
+        neighbors = precompute_chunk_neighbors(store, index, args.chunk_size, args.top_k, search_config)
         
         # Ensure output directory exists
         os.makedirs(os.path.dirname(args.output), exist_ok=True)
         
         # Process embeddings and generate Q&A
-        process_embeddings_in_chunks(embeddings_data, index, texts, args.output, args.chunk_size)
+        process_embeddings_in_chunks(texts, neighbors, args.output, args.chunk_size, args.concurrency)
         
     except Exception as e:
         print(f"ERROR: {e}")
@@ -0,0 +1,246 @@
+"""
+Registry of the Hugging Face sources turned into training records by
+prepare_engine.py. Each entry maps dataset columns to variables and renders
+them into input/context/output (callable templates of template-only sources
+carry a pyarrow.compute twin in `vectorized`); the medqa, symptom_to_diagnosis and
+wiki_medical_terms entries add an LLM step.
+"""
+from prepare_engine import Source, register
+from arrow_transforms import concat, first_item, join_items, lower
+from run_ollama import run_ollama
+
+
+def first(items):
+    """First element of a list column, stripped"""
+    return (items[0] or '').strip() if items else ''
+
+
+# --- Template-only sources ---
+
+register(Source(
+    name='medical_o1_reasoning_sft',
+    repo_id='FreedomIntelligence/medical-o1-reasoning-SFT',
+    folder='medical_o1_reasoning_sft',
+    config='en',
+    fields={'question': 'Question', 'cot': 'Complex_CoT', 'response': 'Response'},
+    input='{question}',
+    # Combine reasoning and response in a single output field
+    output='<reasoning>\n{cot}\n</reasoning>\n{response}',
+    dedupe=False,
+))
+
+register(Source(
+    name='medical_o1_verifiable_problem',
+    repo_id='FreedomIntelligence/medical-o1-verifiable-problem',
+    folder='medical_o1_verifiable_problem',
+    fields={'question': 'Open-ended Verifiable Question', 'answer': 'Ground-True Answer'},
+    input='{question}',
+    output='{answer}',
+))
+
+register(Source(
+    name='medicationqa',
+    repo_id='truehealth/medicationqa',
+    folder='medicationqa',
+    fields={'question': 'Question', 'answer': 'Answer'},
+    input='{question}',
+    output='{answer}',
+    dedupe=False,
+))
+
+register(Source(
+    name='diseases_symptoms',
+    repo_id='QuyenAnhDE/Diseases_Symptoms',
+    folder='diseases_symptoms',
+    fields={'symptoms': 'Symptoms', 'name': 'Name', 'treatments': 'Treatments'},
+    required=('symptoms', 'name', 'treatments'),
+    input='{symptoms}',
+    output='It seems you may have {name}. The usual treatment is {treatments}.',
+))
+
+register(Source(
+    name='first_aid_dataset',
+    repo_id='badri55/First_aid__dataset',
+    folder='first_aid_dataset',
+    fields={'patterns': 'patterns', 'responses': 'responses'},
+    required=('patterns', 'responses'),
+    input=lambda v: first(v['patterns']),
+    output=lambda v: first(v['responses']),
+    vectorized={
+        'input': lambda c: first_item(c['patterns']),
+        'output': lambda c: first_item(c['responses']),
+    },
+))
+
+register(Source(
+    name='synthetic_disaster_reports',
+    repo_id='paulelliotco/synthetic-disaster-reports',
+    folder='synthetic_disaster_reports',
+    fields={
+        'disaster_type': 'disaster_type',
+        'severity': 'severity_level',
+        'responder_notes': 'responder_notes',
+        'resource_needs': 'resource_needs',
+    },
+    required=('disaster_type', 'severity', 'responder_notes', 'resource_needs'),
+    input=lambda v: f"There is a {v['severity'].lower()} {v['disaster_type'].lower()}. Situation: {v['responder_notes']}",
+    output=lambda v: f"The main resources needed are: {', '.join(v['resource_needs'])}.",
+    vectorized={
+        'input': lambda c: concat("There is a ", lower(c['severity']), " ", lower(c['disaster_type']),
+                                  ". Situation: ", c['responder_notes']),
+        'output': lambda c: concat("The main resources needed are: ", join_items(c['resource_needs'], ', '), "."),
+    },
+))
+
+
+# --- LLM-enhanced sources ---
+
+MEDQA_MODEL = 'gemma3n'
+MEDQA_TEMPERATURE = 0.3
+MEDQA_MAX_TOKENS = 3000
+MEDQA_SYSTEM_PROMPT = (
+    "You are a world-class medical doctor. "
+    "Answer as a top clinical expert would: be direct, confident, and provide clear, evidence-based explanations. "
+    "Do NOT include any disclaimers, do NOT mention being an AI, and do NOT add any non-medical advice. "
+    "Do NOT include any non-medical advice. "
+    "Do NOT mention the options enumeration."
+    "Focus only on the clinical reasoning and the correct answer."
+)
+
+
+def medqa_options(v):
+    return "\n".join([f"{k}) {opt}" for k, opt in (v['options'] or {}).items() if opt])
+
+
+def explain_medqa(v, record, seen):
+    user_prompt = (
+        f"Question: {v['question']}\nOptions:\n{record['context']}\n"
+        f"Correct answer: {v['answer']}\n"
+        "Explain why this is the correct answer, and why the other options are not, in a professional and concise manner."
+    )
+    record['output'] = run_ollama(
+        model=MEDQA_MODEL,
+        system_prompt=MEDQA_SYSTEM_PROMPT,
+        user_input=user_prompt,
+        temperature=MEDQA_TEMPERATURE,
+        max_tokens=MEDQA_MAX_TOKENS
+    )
+    return record
+
+
+register(Source(
+    name='medqa',
+    repo_id='truehealth/medqa',
+    folder='medqa',
+    fields={'question': 'question', 'options': 'options', 'answer': 'answer'},
+    input='{question}',
+    context=medqa_options,
+    llm=explain_medqa,
+))
+
+
+SYMPTOM_MODEL = "google/gemma-3n-e4b-it:free"
+SYMPTOM_TEMPERATURE = 0.3
+SYMPTOM_MAX_TOKENS = 300
+SYMPTOM_SYSTEM_PROMPT = (
+    "You are a medical doctor. Given the patient's symptoms and a possible diagnosis, respond as you would to a fellow doctor: "
+    "be clear, professional, and direct. Do NOT justify with scientific evidence, just communicate the likely diagnosis in natural English. "
+    "Do not include any disclaimers or mention being an AI."
+)
+
+
+def describe_diagnosis(v, record, seen):
+    user_prompt = (
+        f"Patient symptoms: {v['symptoms']}\n"
+        f"Diagnosis: {v['diagnosis']}\n"
+        "Write a short, direct response as a doctor would say to another doctor, e.g. 'Based on these symptoms, the most likely diagnosis is ...'"
+    )
+    record['output'] = run_ollama(
+        model=SYMPTOM_MODEL,
+        system_prompt=SYMPTOM_SYSTEM_PROMPT,
+        user_input=user_prompt,
+        temperature=SYMPTOM_TEMPERATURE,
+        max_tokens=SYMPTOM_MAX_TOKENS
+    ).strip()
+    return record
+
+
+register(Source(
+    name='symptom_to_diagnosis',
+    repo_id='gretelai/symptom_to_diagnosis',
+    folder='symptom_to_diagnosis',
+    fields={'symptoms': 'input_text', 'diagnosis': 'output_text'},
+    required=('symptoms', 'diagnosis'),
+    input='{symptoms}',
+    llm=describe_diagnosis,
+))
+
+
+WIKI_MODEL = 'gemma3n'
+WIKI_TEMPERATURE = 0.4
+WIKI_MAX_TOKENS = 500
+WIKI_SYSTEM_PROMPT_QUESTION = (
+    "Given the following medical context, generate a single, highly specific and realistic question that a doctor might have in a moment of doubt about this subject. "
+    "The question must be answerable ONLY using the information in the context. "
+    "It should reflect a genuine clinical uncertainty or decision point, not general knowledge. "
+    "It must be concise (max 20 words), practical, and relevant for medical professionals. "
+    "Do not include any disclaimers or mention being an AI. "
+    "Do not explain how you arrived at the question, just create it.\n"
+)
+WIKI_SYSTEM_PROMPT_ANSWER = (
+    "You are a medical expert. Answer ONLY using the information provided in the context below. "
+    "Be concise, precise, and do NOT invent or hallucinate information."
+    "Do not explain how you are going to answer the question, just create the answer."
+    "Do not include any disclaimers or mention being an AI."
+    "Do not explain how you arrived to the answer, just create it."
+)
+
+
+def generate_wiki_qa(v, record, seen):
+    context = record['context']
+    # Prompt for a specific, context-based medical question
+    user_prompt_q = (
+        f"Context: {context}"
+        "QUESTION MUST BE ONLY OF MEDICAL TERMS, NOT DAILY MEDICAL PROBLEMS."
+        "QUESTION MUST BE VERY CONCISE, NOT MORE THAN 20 WORDS."
+        "QUESTION MUST BE ANSWERABLE ONLY USING THE INFORMATION IN THE CONTEXT."
+        "QUESTION MUST BE RELEVANT FOR MEDICAL PROFESSIONALS."
+        "QUESTION MUST BE PRACTICAL AND REALISTIC."
+        "QUESTION MUST BE ONLY OF MEDICAL TERMS, NOT DAILY MEDICAL PROBLEMS."
+        "QUESTION MUST BE VERY CONCISE, NOT MORE THAN 20 WORDS."
+        "QUESTION MUST BE ANSWERABLE ONLY USING THE INFORMATION IN THE CONTEXT."
+    )
+    record['input'] = run_ollama(
+        model=WIKI_MODEL,
+        system_prompt=WIKI_SYSTEM_PROMPT_QUESTION,
+        user_input=user_prompt_q,
+        temperature=WIKI_TEMPERATURE,
+        max_tokens=WIKI_MAX_TOKENS
+    ).strip()
+    if record['input'] in seen:
+        # Skip the answer call; the engine counts the row as a duplicate
+        return record
+    # Prompt for answer based only on the context
+    user_prompt_a = (
+        f"{context}\n"
+        f"Q: {record['input']}\n"
+        f"A:"
+    )
+    record['output'] = run_ollama(
+        model=WIKI_MODEL,
+        system_prompt=WIKI_SYSTEM_PROMPT_ANSWER,
+        user_input=user_prompt_a,
+        temperature=WIKI_TEMPERATURE,
+        max_tokens=WIKI_MAX_TOKENS
+    ).strip()
+    return record
+
+
+register(Source(
+    name='wiki_medical_terms',
+    repo_id='gamino/wiki_medical_terms',
+    folder='wiki_medical_terms',
+    fields={'text': 'page_text'},
+    context='{text}',
+    llm=generate_wiki_qa,
+))
@@ -1,4 +1,53 @@
+import os
+import atexit
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import ollama
+from llm_cache import ResponseCache, make_cache_key
+
+# Parallel requests kept in flight by run_concurrently; match OLLAMA_NUM_PARALLEL on the server
+OLLAMA_CONCURRENCY = int(os.getenv('OLLAMA_CONCURRENCY', '4'))
+# Per-request timeout in seconds (unset means wait forever, like ollama.chat)
+OLLAMA_TIMEOUT = float(os.getenv('OLLAMA_TIMEOUT', '0')) or None
+
+# Completions are cached on disk so reruns only hit Ollama for new or changed prompts
+OLLAMA_CACHE = os.getenv('OLLAMA_CACHE', '1') != '0'
+OLLAMA_CACHE_PATH = os.getenv(
+    'OLLAMA_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'ollama_responses.sqlite')
+)
+OLLAMA_CACHE_MAX_MB = int(os.getenv('OLLAMA_CACHE_MAX_MB', '1024'))
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(timeout=None):
+    """Return a shared ollama.Client (honours OLLAMA_HOST) for the given timeout"""
+    with _clients_lock:
+        if timeout not in _clients:
+            _clients[timeout] = ollama.Client(timeout=timeout)
+        return _clients[timeout]
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Return the shared response cache, or None when OLLAMA_CACHE=0"""
+    global _cache
+    if not OLLAMA_CACHE:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(OLLAMA_CACHE_PATH, max_bytes=OLLAMA_CACHE_MAX_MB * 1024 * 1024)
+            atexit.register(_report_cache_stats)
+        return _cache
+
+def _report_cache_stats():
+    stats = _cache.stats()
+    if stats['hits'] or stats['misses']:
+        print(f"INFO: Ollama cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate']:.1%} hit rate, {stats['entries']} entries in {OLLAMA_CACHE_PATH})")
 
 def clean_markdown_response(response):
     if not response:
@@ -18,8 +67,28 @@ def clean_markdown_response(response):
     
     return cleaned
 
-def run_ollama(model, system_prompt, user_input, temperature=0.7, top_p=1.0, max_tokens=512):
-    response = ollama.chat(
+def run_ollama(model, system_prompt, user_input, temperature=0.7, top_p=1.0, max_tokens=512, timeout=OLLAMA_TIMEOUT, use_cache=True):
+    """
+    Chat completion with on-disk caching. Pass use_cache=False to sample a fresh
+    output; it replaces the cached one for the same request.
+    """
+    cache = get_cache()
+    key = None
+    if cache is not None:
+        key = make_cache_key(
+            model=model,
+            system_prompt=system_prompt,
+            user_input=user_input,
+            temperature=temperature,
+            top_p=top_p,
+            num_predict=max_tokens
+        )
+        if use_cache:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+
+    response = get_client(timeout).chat(
         model=model,
         messages=[
             {"role": "system", "content": system_prompt},
@@ -34,4 +103,51 @@ def run_ollama(model, system_prompt, user_input, temperature=0.7, top_p=1.0, max
 
     raw_content = response['message']['content']
     cleaned_content = clean_markdown_response(raw_content)
-    return cleaned_content
\ No newline at end of file
+    if cache is not None and cleaned_content:
+        cache.put(key, cleaned_content)
+    return cleaned_content
+
+def run_concurrently(fn, items, concurrency=OLLAMA_CONCURRENCY, ordered=True):
+    """
+    Apply fn (typically a function wrapping one or more run_ollama calls) to items
+    with at most `concurrency` calls in flight.
+
+    Yields (item, result, error) tuples: in input order when `ordered` is set,
+    otherwise as soon as each call finishes. Items are pulled lazily, so a long
+    generator of rows is never materialized.
+    """
+    items = iter(items)
+
+    if concurrency <= 1:
+        for item in items:
+            try:
+                yield item, fn(item), None
+            except Exception as e:
+                yield item, None, e
+        return
+
+    def outcome(item, future):
+        error = future.exception()
+        return item, (None if error else future.result()), error
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        if ordered:
+            in_flight = deque()
+            for item in items:
+                in_flight.append((item, pool.submit(fn, item)))
+                if len(in_flight) >= concurrency:
+                    yield outcome(*in_flight.popleft())
+            while in_flight:
+                yield outcome(*in_flight.popleft())
+        else:
+            in_flight = {}
+            for item in items:
+                in_flight[pool.submit(fn, item)] = item
+                if len(in_flight) >= concurrency:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield outcome(in_flight.pop(future), future)
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield outcome(in_flight.pop(future), future)
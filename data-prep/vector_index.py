@@ -0,0 +1,258 @@
+"""
+FAISS indexes persisted next to an embedding store.
+
+Supported index types:
+    flat      exact inner-product search (IndexFlatIP)
+    hnsw      graph-based approximate search (IndexHNSWFlat)
+    ivf-flat  inverted lists over uncompressed vectors (IndexIVFFlat)
+    ivf-pq    inverted lists over product-quantized vectors (IndexIVFPQ)
+
+Each type is written to `<store>/index.<type>.faiss` together with
+`index.<type>.json`, which records the store fingerprint, row count and build
+parameters. Loading checks that record against the store: an exact match is
+memory-mapped straight from disk, a match on an older prefix of the store only
+adds the new rows, and anything else (or different build parameters) triggers
+a rebuild. Stores indexed before index types existed have a flat
+`index.faiss`/`index.json` pair, which is renamed to the flat index on first use.
+Store rows are unit-norm, so inner product is cosine similarity.
+"""
+import os
+import glob
+import json
+import hashlib
+import numpy as np
+import faiss
+
+INDEX_TYPES = ('flat', 'hnsw', 'ivf-flat', 'ivf-pq')
+ADD_BATCH = 65536
+TRAIN_SAMPLE = 100000
+# Single flat index written by earlier versions
+LEGACY_INDEX = ('index.faiss', 'index.json')
+
+# Build-time parameters; None means "derive from the store size"
+DEFAULT_PARAMS = {
+    'hnsw': {'hnsw_m': 32, 'ef_construction': 200},
+    'ivf-flat': {'nlist': None},
+    'ivf-pq': {'nlist': None, 'pq_m': 64, 'nbits': 8},
+}
+
+
+def default_nlist(n):
+    # ~4*sqrt(n) lists, keeping at least 39 training points per centroid as FAISS recommends
+    return max(1, min(int(4 * np.sqrt(n)), n // 39))
+
+
+def resolve_params(kind, n, dim, params=None):
+    """Fill in defaults for the build parameters that apply to `kind`"""
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {kind} (expected one of {INDEX_TYPES})")
+    resolved = dict(DEFAULT_PARAMS.get(kind, {}))
+    for key, value in (params or {}).items():
+        if key in resolved and value is not None:
+            resolved[key] = value
+    if 'nlist' in resolved and resolved['nlist'] is None:
+        resolved['nlist'] = default_nlist(n)
+    if 'pq_m' in resolved:
+        # PQ needs the dimension to split evenly into sub-quantizers
+        while dim % resolved['pq_m']:
+            resolved['pq_m'] -= 1
+    if 'nbits' in resolved:
+        # Training needs at least 2**nbits vectors per sub-quantizer codebook
+        resolved['nbits'] = max(1, min(resolved['nbits'], int(np.log2(max(n, 2)))))
+    return resolved
+
+
+def make_index(kind, dim, params):
+    if kind == 'flat':
+        return faiss.IndexFlatIP(dim)
+    if kind == 'hnsw':
+        index = faiss.IndexHNSWFlat(dim, params['hnsw_m'], faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = params['ef_construction']
+        return index
+    quantizer = faiss.IndexFlatIP(dim)
+    if kind == 'ivf-flat':
+        index = faiss.IndexIVFFlat(quantizer, dim, params['nlist'], faiss.METRIC_INNER_PRODUCT)
+    else:
+        index = faiss.IndexIVFPQ(quantizer, dim, params['nlist'], params['pq_m'], params['nbits'], faiss.METRIC_INNER_PRODUCT)
+    return index
+
+
+def configure_search(index, nprobe=None, ef_search=None):
+    """Apply query-time parameters; ignored for index types they don't apply to"""
+    if nprobe is not None:
+        try:
+            faiss.extract_index_ivf(index).nprobe = nprobe
+        except RuntimeError:
+            pass
+    if ef_search is not None and hasattr(index, 'hnsw'):
+        index.hnsw.efSearch = ef_search
+    return index
+
+
+def index_paths(store, kind='flat'):
+    return (
+        os.path.join(store.path, f'index.{kind}.faiss'),
+        os.path.join(store.path, f'index.{kind}.json'),
+    )
+
+
+def migrate_legacy_index(store):
+    """Rename the flat index.faiss/index.json of an older store to the flat index paths, or drop it if superseded"""
+    legacy = [os.path.join(store.path, name) for name in LEGACY_INDEX]
+    if not any(os.path.exists(path) for path in legacy):
+        return
+    current = index_paths(store, 'flat')
+    if all(os.path.exists(path) for path in legacy) and not os.path.exists(current[0]):
+        for old, new in zip(legacy, current):
+            os.replace(old, new)
+        print(f"INFO: Moved legacy FAISS index to {current[0]}")
+    else:
+        for path in legacy:
+            if os.path.exists(path):
+                os.remove(path)
+        print(f"INFO: Removed legacy FAISS index from {store.path}")
+
+
+def read_index_meta(store, kind='flat'):
+    _, meta_path = index_paths(store, kind)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def add_rows(index, store, start=0):
+    """Add store rows [start:] to the index in batches (rows are already unit-norm)"""
+    vectors = store.vectors()
+    for i in range(start, len(store), ADD_BATCH):
+        index.add(np.ascontiguousarray(vectors[i:i+ADD_BATCH], dtype=np.float32))
+    return index
+
+
+def build_index(store, kind='flat', params=None, seed=0):
+    params = resolve_params(kind, len(store), store.dim, params)
+    print(f"INFO: Building {kind} FAISS index over {len(store)} vectors (dimension: {store.dim}, params: {params})")
+    index = make_index(kind, store.dim, params)
+    if not index.is_trained:
+        vectors = store.vectors()
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(len(store), size=min(len(store), TRAIN_SAMPLE), replace=False))
+        index.train(np.ascontiguousarray(vectors[sample], dtype=np.float32))
+    return add_rows(index, store), params
+
+
+def save_index(store, index, kind='flat', params=None):
+    index_path, meta_path = index_paths(store, kind)
+    faiss.write_index(index, index_path + '.tmp')
+    os.replace(index_path + '.tmp', index_path)
+    meta = {'count': index.ntotal, 'fingerprint': store.fingerprint, 'params': params or {}}
+    with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(meta_path + '.tmp', meta_path)
+
+
+def _read(index_path, mmap):
+    if mmap:
+        try:
+            return faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            # Older FAISS builds cannot mmap every index type; fall back to a regular read
+            pass
+    return faiss.read_index(index_path)
+
+
+def _params_match(meta, params):
+    built = meta.get('params', {})
+    return all(built.get(key) == value for key, value in (params or {}).items() if key in built and value is not None)
+
+
+def _requested_params(store, kind, params):
+    """The explicitly requested parameters as a build would resolve them (e.g. pq_m fitted to the dimension)"""
+    resolved = resolve_params(kind, len(store), store.dim, params)
+    return {key: resolved[key] for key, value in (params or {}).items() if key in resolved and value is not None}
+
+
+def _is_current(store, kind, params):
+    index_path, _ = index_paths(store, kind)
+    meta = read_index_meta(store, kind)
+    return (
+        meta is not None and os.path.exists(index_path)
+        and meta['fingerprint'] == store.fingerprint and _params_match(meta, _requested_params(store, kind, params))
+    )
+
+
+def update_index(store, kind='flat', params=None):
+    """Bring the persisted index in line with the store, adding only new rows when possible"""
+    migrate_legacy_index(store)
+    index_path, _ = index_paths(store, kind)
+    meta = read_index_meta(store, kind)
+
+    if _is_current(store, kind, params):
+        print(f"INFO: {kind} FAISS index is up to date ({meta['count']} vectors)")
+        return
+    if (meta and os.path.exists(index_path) and _params_match(meta, _requested_params(store, kind, params))
+            and store.has_prefix(meta['count'], meta['fingerprint'])):
+        index = _read(index_path, mmap=False)
+        built_params = meta.get('params', {})
+        print(f"INFO: Adding {len(store) - index.ntotal} new vectors to {kind} FAISS index")
+        add_rows(index, store, start=index.ntotal)
+    else:
+        index, built_params = build_index(store, kind, params)
+    save_index(store, index, kind, built_params)
+    print(f"SUCCESS: Saved {kind} FAISS index with {index.ntotal} vectors to {index_path}")
+
+
+def load_index(store, kind='flat', params=None, nprobe=None, ef_search=None, mmap=True):
+    """Load the persisted index (memory-mapped when it matches the store), updating it if stale"""
+    migrate_legacy_index(store)
+    index_path, _ = index_paths(store, kind)
+    if not _is_current(store, kind, params):
+        update_index(store, kind, params)
+    index = _read(index_path, mmap)
+    configure_search(index, nprobe=nprobe, ef_search=ef_search)
+    print(f"SUCCESS: Loaded {kind} FAISS index with {index.ntotal} vectors from {index_path}")
+    return index
+
+
+SEARCH_BATCH = 16384
+
+
+def batch_search(index, queries, k):
+    """Search many queries at once, in slices that bound the distance-matrix memory"""
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    scores = np.empty((len(queries), k), dtype=np.float32)
+    for i in range(0, len(queries), SEARCH_BATCH):
+        batch = np.ascontiguousarray(queries[i:i+SEARCH_BATCH], dtype=np.float32)
+        scores[i:i+len(batch)], ids[i:i+len(batch)] = index.search(batch, k)
+    return ids, scores
+
+
+def precompute_neighbors(store, index, query_rows, k, config):
+    """
+    Run one batched search for the given store rows and cache the kNN graph as
+    `<store>/neighbors.<hash>.npz` (ids and scores, one row per query). The cache
+    is reused while the store fingerprint, query rows, k and `config` (index
+    type and search parameters) are unchanged; writing a new graph deletes the
+    stale ones.
+    """
+    query_rows = np.asarray(query_rows, dtype=np.int64)
+    key = json.dumps({'fingerprint': store.fingerprint, 'k': k, 'config': config}, sort_keys=True)
+    rows_digest = hashlib.sha256(query_rows.tobytes()).hexdigest()
+    path = os.path.join(store.path, f"neighbors.{hashlib.sha256((key + rows_digest).encode('utf-8')).hexdigest()[:16]}.npz")
+
+    if os.path.exists(path):
+        cached = np.load(path)
+        if str(cached['key']) == key and np.array_equal(cached['query_rows'], query_rows):
+            print(f"INFO: Loaded {len(query_rows)} precomputed neighbor lists from {path}")
+            return cached['ids'], cached['scores']
+
+    print(f"INFO: Searching neighbors for {len(query_rows)} queries (k={k})")
+    ids, scores = batch_search(index, store.vectors()[query_rows], k)
+    with open(path + '.tmp', 'wb') as f:
+        np.savez(f, ids=ids, scores=scores, query_rows=query_rows, key=np.array(key))
+    os.replace(path + '.tmp', path)
+    for stale in glob.glob(os.path.join(store.path, 'neighbors.*.npz')):
+        if stale != path:
+            os.remove(stale)
+    print(f"SUCCESS: Saved neighbor graph to {path}")
+    return ids, scores
@@ -1,22 +1,20 @@
 """
-Extract text from PDFs, split into chunks, and generate embeddings using Cohere
+Extract text from PDFs, split into chunks, and generate embeddings (Cohere by default)
 Combines first aid and rescue knowledge processing
 """
 import os
 import glob
-import PyPDF2
-import cohere
-import numpy as np
-from tqdm import tqdm
 import json
+import hashlib
+import numpy as np
 import dotenv
 import argparse
 dotenv.load_dotenv()
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-
-COHERE_API_KEY = os.getenv('COHERE_API_KEY')
-assert COHERE_API_KEY, 'Set COHERE_API_KEY env variable'
-co = cohere.Client(COHERE_API_KEY)
+from embedding_store import EmbeddingStore, DTYPES
+from vector_index import update_index
+from pdf_text import extract_pdfs, file_sha256
+from embedding_backends import BACKENDS, EMBED_CONCURRENCY, EMBED_BATCH_TOKENS, LEGACY_MODEL_ID, get_backend, embed_texts
 
 # Configuration - combining both sets of directories
 FIRST_AID_DIRS = [
@@ -38,95 +36,142 @@ RESCUE_DIRS = [
     "data/preparedbc_neighbourhood_guide",
 ]
 
-def process_pdfs(pdf_dirs, output_path, description=""):
-    """Process PDFs from given directories and generate embeddings"""
+def open_store(output_path, dtype="float32"):
+    """Open the embedding store, converting a legacy JSON file next to it on first use"""
+    if EmbeddingStore.exists(output_path):
+        return EmbeddingStore(output_path)
+    legacy_json = output_path + '.json'
+    if os.path.exists(legacy_json):
+        return EmbeddingStore.from_json(legacy_json, output_path, dtype)
+    return None
+
+SPLITTER_CONFIG = {
+    'chunk_size': 512,  # Size of text chunks for embeddings
+    'chunk_overlap': 128,  # Overlap between chunks to preserve context
+    'separators': ["\n\n", "\n", ".", " ", ""],
+    'min_chars': 50,  # Minimum chunk size
+}
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def manifest_path_for(output_path):
+    return output_path + '.manifest.json'
+
+def load_manifest(path):
+    """
+    The manifest records the embedding model and, per PDF, the file hash and the
+    [chunk_id, text hash] pairs it produced with SPLITTER_CONFIG. Changing the
+    splitter invalidates every entry, but chunks whose text did not change still
+    reuse their vectors.
+    """
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        manifest.setdefault('embedding', LEGACY_MODEL_ID)
+        if manifest.get('splitter') == SPLITTER_CONFIG:
+            return manifest
+        print("INFO: Splitter configuration changed, re-chunking every PDF")
+        return {'splitter': SPLITTER_CONFIG, 'embedding': manifest['embedding'], 'pdfs': {}}
+    return {'splitter': SPLITTER_CONFIG, 'embedding': None, 'pdfs': {}}
+
+def save_manifest(path, manifest):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+def process_pdfs(pdf_dirs, output_path, description="", dtype="float32", workers=None, backend=None,
+                 concurrency=EMBED_CONCURRENCY, batch_tokens=EMBED_BATCH_TOKENS):
+    """Process PDFs from given directories and generate embeddings for new chunk texts only"""
     
     print(f"INFO: Processing {description}")
     print(f"INFO: Output file: {output_path}")
     
-    # Configuration
-    CHUNK_SIZE = 512  # Size of text chunks for embeddings
-    CHUNK_OVERLAP = 128  # Overlap between chunks to preserve context
-    
-    # Load existing embeddings
-    if os.path.exists(output_path):
-        with open(output_path, 'r') as f:
-            out = json.load(f)
-    else:
-        out = []
+    backend = backend or get_backend('cohere')
 
-    # Track existing entries to avoid duplicates
-    existing = set((entry['pdf'], entry['chunk_id']) for entry in out)
+    # Load existing embeddings (the store is created with the first batch, once the dimension is known)
+    store = open_store(output_path, dtype)
+    manifest_path = manifest_path_for(output_path)
+    manifest = load_manifest(manifest_path)
+
+    # Vectors from different models are not comparable, so a store only ever holds one
+    stored_model = manifest['embedding'] or (LEGACY_MODEL_ID if store and len(store) else None)
+    if stored_model and stored_model != backend.model_id:
+        raise ValueError(
+            f"{output_path} holds {stored_model} embeddings; use another --output-dir for {backend.model_id}"
+        )
+    if manifest['embedding'] != backend.model_id:
+        # Recorded before the first batch, so an interrupted first run is not read back as legacy vectors
+        manifest['embedding'] = backend.model_id
+        save_manifest(manifest_path, manifest)
+
+    # Text hash of every stored row; rows written before the manifest existed are hashed here
+    stored_hashes = []
+    if store:
+        stored_hashes = [m.get('text_hash') or text_hash(t) for m, t in zip(store.meta(), store.texts())]
+    stored_keys = set(
+        (m['pdf'], m['chunk_id'], h) for m, h in zip(store.meta(), stored_hashes)
+    ) if store else set()
 
     pdf_files = []
     for d in pdf_dirs:
         pdf_files.extend(glob.glob(os.path.join(d, '*.pdf')))
 
     splitter = RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP,
-        separators=["\n\n", "\n", ".", " ", ""]
+        chunk_size=SPLITTER_CONFIG['chunk_size'],
+        chunk_overlap=SPLITTER_CONFIG['chunk_overlap'],
+        separators=SPLITTER_CONFIG['separators']
     )
 
-    all_chunks = []
-    meta = []
     pdf_stats = {
         'total_found': len(pdf_files),
         'successfully_processed': 0,
+        'unchanged': 0,
         'failed_to_read': 0,
         'failed_files': []
     }
 
     print(f"INFO: Found {len(pdf_files)} PDF files to process")
 
+    # A PDF is skipped when its bytes match the manifest and all of its chunks are in the store
+    to_extract = []
+    for pdf_path in pdf_files:
+        entry = manifest['pdfs'].get(os.path.basename(pdf_path))
+        try:
+            unchanged = (
+                entry is not None and entry['sha256'] == file_sha256(pdf_path)
+                and all((os.path.basename(pdf_path), chunk_id, h) in stored_keys for chunk_id, h in entry['chunks'])
+            )
+        except OSError:
+            unchanged = False
+        if not unchanged:
+            to_extract.append(pdf_path)
+
+    # Extract changed PDFs in parallel; pages already in the cache are not parsed again
+    extracted = extract_pdfs(to_extract, workers=workers)
+
+    pdfs = {}
+    chunk_texts = {}
     for pdf_path in pdf_files:
         pdf_name = os.path.basename(pdf_path)
+        if pdf_path not in extracted:
+            pdfs[pdf_name] = manifest['pdfs'][pdf_name]
+            pdf_stats['unchanged'] += 1
+            continue
         
         try:
             print(f"INFO: Processing {pdf_name}...")
             
-            # Check if file exists and is readable
-            if not os.path.exists(pdf_path):
-                raise FileNotFoundError(f"PDF file not found: {pdf_path}")
+            result = extracted[pdf_path]
+            if isinstance(result, Exception):
+                raise result
             
-            if os.path.getsize(pdf_path) == 0:
-                raise ValueError(f"PDF file is empty: {pdf_path}")
+            text = result['text']
+            if not text.strip():
+                raise ValueError(f"No extractable text found in PDF: {pdf_name}")
             
-            with open(pdf_path, 'rb') as f:
-                try:
-                    reader = PyPDF2.PdfReader(f)
-                    
-                    # Check if PDF is encrypted
-                    if reader.is_encrypted:
-                        print(f"WARNING: PDF {pdf_name} is encrypted, attempting to decrypt...")
-                        # Try to decrypt with empty password
-                        if not reader.decrypt(''):
-                            raise ValueError(f"Could not decrypt encrypted PDF: {pdf_name}")
-                    
-                    # Check if PDF has pages
-                    if len(reader.pages) == 0:
-                        raise ValueError(f"PDF has no pages: {pdf_name}")
-                    
-                    text = ''
-                    pages_processed = 0
-                    
-                    for page_num, page in enumerate(reader.pages):
-                        try:
-                            page_text = page.extract_text()
-                            if page_text:
-                                text += page_text
-                                pages_processed += 1
-                        except Exception as page_error:
-                            print(f"WARNING: Failed to extract text from page {page_num + 1} of {pdf_name}: {page_error}")
-                            continue
-                    
-                    if not text.strip():
-                        raise ValueError(f"No extractable text found in PDF: {pdf_name}")
-                    
-                    print(f"SUCCESS: Extracted text from {pages_processed}/{len(reader.pages)} pages of {pdf_name}")
-                    
-                except PyPDF2.errors.PdfReadError as pdf_error:
-                    raise ValueError(f"PyPDF2 could not read PDF {pdf_name}: {pdf_error}")
+            print(f"SUCCESS: Extracted text from {result['pages_processed']}/{result['total_pages']} pages of {pdf_name}")
                 
             # Split text into chunks using LangChain
             chunks = splitter.split_text(text)
@@ -134,60 +179,104 @@ def process_pdfs(pdf_dirs, output_path, description=""):
             if not chunks:
                 raise ValueError(f"No text chunks generated from {pdf_name}")
             
-            chunks_added = 0
-            for chunk_id, chunk in enumerate(chunks):
-                if (pdf_name, chunk_id) in existing:
-                    continue
-                
-                # Only add chunks with meaningful content
-                if len(chunk.strip()) > 50:  # Minimum chunk size
-                    all_chunks.append(chunk)
-                    meta.append({'pdf': pdf_name, 'chunk_id': chunk_id})
-                    chunks_added += 1
+            # Only keep chunks with meaningful content
+            kept = [(chunk_id, chunk) for chunk_id, chunk in enumerate(chunks)
+                    if len(chunk.strip()) > SPLITTER_CONFIG['min_chars']]
+            pdfs[pdf_name] = {'sha256': result['sha256'], 'chunks': [[chunk_id, text_hash(chunk)] for chunk_id, chunk in kept]}
+            chunk_texts.update(((pdf_name, chunk_id), chunk) for chunk_id, chunk in kept)
             
             pdf_stats['successfully_processed'] += 1
-            print(f"SUCCESS: Added {chunks_added} new chunks from {pdf_name}")
+            print(f"SUCCESS: Split {pdf_name} into {len(kept)} chunks")
             
         except Exception as e:
             pdf_stats['failed_to_read'] += 1
             pdf_stats['failed_files'].append({'file': pdf_name, 'error': str(e)})
             print(f"ERROR: Failed to process {pdf_name}: {e}")
+            # Keep the embeddings of the last readable version until the PDF can be read again
+            if pdf_name in manifest['pdfs']:
+                pdfs[pdf_name] = manifest['pdfs'][pdf_name]
             continue
 
-    print(f'Generating embeddings for {len(all_chunks)} new chunks...')
-    embeddings = []
-    BATCH = 32  # Process embeddings in batches to avoid API rate limits
-    for i in tqdm(range(0, len(all_chunks), BATCH)):
-        batch = all_chunks[i:i+BATCH]
-        batch_meta = meta[i:i+BATCH]
-        resp = co.embed(texts=batch, model='embed-v4.0', input_type='search_document')
-        for j, emb in enumerate(resp.embeddings):
-            entry = {
-                'text': batch[j],
-                'embedding': emb,
-                'pdf': batch_meta[j]['pdf'],
-                'chunk_id': batch_meta[j]['chunk_id']
-            }
-            out.append(entry)
-            existing.add((batch_meta[j]['pdf'], batch_meta[j]['chunk_id']))
-        # Save incrementally after each batch to prevent data loss
-        with open(output_path, 'w') as f:
-            json.dump(out, f, indent=2, ensure_ascii=False)
+    wanted = {(pdf_name, chunk_id): h for pdf_name, entry in pdfs.items() for chunk_id, h in entry['chunks']}
+
+    # Rows still wanted are kept; a chunk whose text is already stored anywhere reuses that vector
+    keep_rows, keep_metas, present = [], [], set()
+    row_by_hash = {}
+    for row, (m, h) in enumerate(zip(store.meta() if store else [], stored_hashes)):
+        row_by_hash.setdefault(h, row)
+        key = (m['pdf'], m['chunk_id'])
+        if wanted.get(key) == h and key not in present:
+            present.add(key)
+            keep_rows.append(row)
+            keep_metas.append({'pdf': m['pdf'], 'chunk_id': m['chunk_id'], 'text_hash': h})
+    removed = len(stored_hashes) - len(keep_rows)
+
+    reuse_rows, reuse_metas, pending = [], [], []
+    for (pdf_name, chunk_id), h in wanted.items():
+        if (pdf_name, chunk_id) in present:
+            continue
+        meta = {'pdf': pdf_name, 'chunk_id': chunk_id, 'text_hash': h}
+        if h in row_by_hash:
+            reuse_rows.append(row_by_hash[h])
+            reuse_metas.append(meta)
+        elif (pdf_name, chunk_id) in chunk_texts:
+            pending.append(meta)
+
+    if removed:
+        # Garbage-collect rows of removed or changed chunks, carrying reused vectors into the new store
+        print(f"INFO: Removing {removed} stale chunks from {output_path}")
+        store = store.compact(keep_rows + reuse_rows, keep_metas + reuse_metas)
+    elif reuse_rows:
+        store.copy_rows(reuse_rows, reuse_metas)
+
+    # Identical texts (e.g. repeated boilerplate) are embedded once
+    new_texts = {}
+    for meta in pending:
+        new_texts.setdefault(meta['text_hash'], chunk_texts[(meta['pdf'], meta['chunk_id'])])
+    hashes = list(new_texts)
+
+    print(f'Generating embeddings for {len(hashes)} new chunk texts ({len(reuse_rows)} chunks reused)...')
+    pending_by_hash = {}
+    for meta in pending:
+        pending_by_hash.setdefault(meta['text_hash'], []).append(meta)
+    texts = [new_texts[h] for h in hashes]
+    for start, embeddings in embed_texts(backend, texts, concurrency=concurrency, max_tokens=batch_tokens):
+        if store is None:
+            store = EmbeddingStore.create(output_path, len(embeddings[0]), dtype)
+        batch_vectors, batch_texts, batch_meta = [], [], []
+        for h, embedding in zip(hashes[start:start + len(embeddings)], embeddings):
+            for meta in pending_by_hash[h]:
+                batch_vectors.append(embedding)
+                batch_texts.append(new_texts[h])
+                batch_meta.append(meta)
+        # Appending a batch writes only the new rows, so progress is kept on interruption
+        store.append(batch_vectors, batch_texts, batch_meta)
+
+    # Written last: an interrupted run re-checks its PDFs against the store next time
+    manifest = {'splitter': SPLITTER_CONFIG, 'embedding': backend.model_id, 'pdfs': pdfs}
+    save_manifest(manifest_path, manifest)
         
-    print(f"Incremental save to {output_path}. Total: {len(out)} chunks.")
+    total = len(store) if store else 0
+    print(f"Incremental save to {output_path}. Total: {total} chunks.")
+    
+    # Persist the FAISS index next to the store so generation jobs only load it
+    if store is not None and len(store):
+        update_index(store)
     
     # Print final statistics
     print(f"\n=== PDF Processing Statistics for {description} ===")
     print(f"Total PDFs found: {pdf_stats['total_found']}")
+    print(f"Unchanged (skipped): {pdf_stats['unchanged']}")
     print(f"Successfully processed: {pdf_stats['successfully_processed']}")
     print(f"Failed to read: {pdf_stats['failed_to_read']}")
+    print(f"Chunks embedded: {len(pending)}, reused: {len(reuse_rows)}, removed: {removed}")
     
     if pdf_stats['failed_files']:
         print(f"\nFailed files:")
         for failed in pdf_stats['failed_files']:
             print(f"  - {failed['file']}: {failed['error']}")
     
-    return len(out)
+    return total
 
 def main():
     parser = argparse.ArgumentParser(description="Extract text from medical PDFs and generate embeddings")
@@ -195,24 +284,36 @@ def main():
                        help="Type of documents to process")
     parser.add_argument("--output-dir", default="data-prep/json/embeddings",
                        help="Output directory for embeddings")
+    parser.add_argument("--workers", type=int, default=None,
+                       help="Processes used for PDF text extraction (default: all cores)")
+    parser.add_argument("--dtype", choices=DTYPES, default="float32",
+                       help="On-disk precision of the embedding store (float16/int8 are quantized)")
+    parser.add_argument("--backend", choices=list(BACKENDS), default="cohere",
+                       help="Embedding backend (hashing runs offline, for tests and benchmarks)")
+    parser.add_argument("--concurrency", type=int, default=EMBED_CONCURRENCY,
+                       help="Embedding batches kept in flight (default: EMBED_CONCURRENCY or 4)")
+    parser.add_argument("--batch-tokens", type=int, default=EMBED_BATCH_TOKENS,
+                       help="Estimated token budget per embedding request")
     
     args = parser.parse_args()
     
     # Ensure output directory exists
     os.makedirs(args.output_dir, exist_ok=True)
+    backend = get_backend(args.backend)
+    embed_options = dict(backend=backend, concurrency=args.concurrency, batch_tokens=args.batch_tokens)
     
     if args.type == "firstaid":
-        output_path = os.path.join(args.output_dir, "first_aid_embeddings.json")
-        total_chunks = process_pdfs(FIRST_AID_DIRS, output_path, "First Aid Documents")
+        output_path = os.path.join(args.output_dir, "first_aid_embeddings")
+        total_chunks = process_pdfs(FIRST_AID_DIRS, output_path, "First Aid Documents", args.dtype, args.workers, **embed_options)
         
     elif args.type == "rescue":
-        output_path = os.path.join(args.output_dir, "rescue_embeddings.json")
-        total_chunks = process_pdfs(RESCUE_DIRS, output_path, "Rescue Documents")
+        output_path = os.path.join(args.output_dir, "rescue_embeddings")
+        total_chunks = process_pdfs(RESCUE_DIRS, output_path, "Rescue Documents", args.dtype, args.workers, **embed_options)
         
     elif args.type == "combined":
-        output_path = os.path.join(args.output_dir, "medical_knowledge_embeddings.json")
+        output_path = os.path.join(args.output_dir, "medical_knowledge_embeddings")
         combined_dirs = FIRST_AID_DIRS + RESCUE_DIRS
-        total_chunks = process_pdfs(combined_dirs, output_path, "Combined Medical Knowledge")
+        total_chunks = process_pdfs(combined_dirs, output_path, "Combined Medical Knowledge", args.dtype, args.workers, **embed_options)
     
     print(f"\n=== FINAL RESULTS ===")
     print(f"Successfully generated embeddings for {total_chunks} total chunks")
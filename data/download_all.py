@@ -1,29 +1,352 @@
 import os
 import json
+import time
+import hashlib
+import argparse
 import threading
-import subprocess
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
-from datasets import load_dataset
-from kaggle.api.kaggle_api_extended import KaggleApi
 
-with open(os.path.join(os.path.dirname(__file__), 'datasets_to_download.json')) as f:
-    DATASETS = json.load(f)
+DATASETS_FILE = os.path.join(os.path.dirname(__file__), 'datasets_to_download.json')
+DATA_DIR = 'data'
+# sha256, size and HTTP validators of every completed direct download
+MANIFEST_FILE = 'download_manifest.json'
+
+MAX_WORKERS = int(os.getenv('DOWNLOAD_WORKERS', '4'))
+MAX_RETRIES = 3
+CHUNK_SIZE = 1024 * 1024
+# Small enough that little is lost when a connection drops mid-chunk
+STREAM_CHUNK = 64 * 1024
+# Direct downloads of at least MIN_RANGE_SIZE bytes are split into RANGE_PARTS concurrent ranges
+RANGE_PARTS = int(os.getenv('DOWNLOAD_RANGE_PARTS', '4'))
+MIN_RANGE_SIZE = 8 * 1024 * 1024
+# Range progress is flushed to the .part.json sidecar every RANGE_SAVE_EVERY bytes per range
+RANGE_SAVE_EVERY = 4 * 1024 * 1024
+TIMEOUT = (30, 60)
+
+# Enhanced headers to avoid being blocked. Compression is disabled so byte
+# offsets of Range requests match the file on disk.
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'application/pdf,application/octet-stream,*/*',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'identity',
+    'DNT': '1',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+}
 
 results = {}
-threads = []
 
-# Setup Kaggle API only if needed
-api = None
-for d in DATASETS:
-    if d['type'] == 'kaggle':
-        os.environ['KAGGLE_CONFIG_DIR'] = os.path.abspath('credentials')
-        api = KaggleApi()
-        api.authenticate()
-        break
+
+def make_session(pool_size=MAX_WORKERS * RANGE_PARTS):
+    """One keep-alive connection pool shared by every direct download"""
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """Completed direct downloads keyed by destination path, saved after every change"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def get(self, key):
+        with self._lock:
+            return self.entries.get(key)
+
+    def put(self, key, entry):
+        with self._lock:
+            self.entries[key] = entry
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+
+def validators(response):
+    return {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    }
+
+
+def load_part_meta(part_file, url):
+    """Validators of the response a .part file came from, if it came from this URL"""
+    try:
+        with open(part_file + '.json', 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get('url') == url else None
+
+
+def save_part_meta(part_file, url, meta):
+    tmp_path = part_file + '.json.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'url': url, **meta}, f)
+    os.replace(tmp_path, part_file + '.json')
+
+
+class RemoteChanged(Exception):
+    pass
+
+
+def fetch_ranges(session, url, part_file, desc, meta, parts=RANGE_PARTS):
+    """
+    Fetch `url` as `parts` byte ranges over concurrent connections, each written
+    at its offset in a preallocated `part_file`. Progress per range is saved to
+    the .part.json sidecar every RANGE_SAVE_EVERY bytes (after flushing the
+    bytes it covers), so a failed or killed attempt resumes only the missing
+    bytes.
+    Returns (validators, bytes received, connections used).
+    """
+    size = meta['size']
+    if not meta.get('ranges') or not os.path.exists(part_file):
+        step = -(-size // parts)
+        meta['ranges'] = [[start, min(start + step, size) - 1, 0] for start in range(0, size, step)]
+        with open(part_file, 'wb') as f:
+            f.truncate(size)
+        save_part_meta(part_file, url, meta)
+    ranges = meta['ranges']
+    validator = meta.get('etag') or meta.get('last_modified')
+    lock = threading.Lock()
+    received = [0]
+
+    def fetch(span):
+        start, end, done = span
+        if start + done > end:
+            return
+        headers = {'Range': f'bytes={start + done}-{end}', 'If-Range': validator}
+        with session.get(url, stream=True, timeout=TIMEOUT, headers=headers) as r:
+            r.raise_for_status()
+            if r.status_code != 206:
+                raise RemoteChanged("Remote file changed during a ranged download; restarting")
+            try:
+                with open(part_file, 'r+b') as f:
+                    f.seek(start + done)
+                    for chunk in r.iter_content(chunk_size=STREAM_CHUNK):
+                        if chunk:
+                            f.write(chunk)
+                            done += len(chunk)
+                            with lock:
+                                received[0] += len(chunk)
+                                bar.update(len(chunk))
+                            if done - span[2] >= RANGE_SAVE_EVERY:
+                                # Only bytes that reached the file are recorded as done
+                                f.flush()
+                                with lock:
+                                    span[2] = done
+                                    save_part_meta(part_file, url, meta)
+            finally:
+                # The file is closed (flushed) here, whether the stream finished or broke off
+                with lock:
+                    span[2] = done
+        if start + span[2] <= end:
+            raise Exception(f"Range {start}-{end} closed after {span[2]} of {end - start + 1} bytes")
+
+    pending = [span for span in ranges if span[0] + span[2] <= span[1]]
+    already = sum(span[2] for span in ranges)
+    with tqdm(total=size, initial=already, unit='B', unit_scale=True, desc=desc) as bar, \
+            ThreadPoolExecutor(max_workers=max(1, len(pending))) as pool:
+        futures = [pool.submit(fetch, span) for span in pending]
+    errors = [f.exception() for f in futures if f.exception() is not None]
+
+    changed = [e for e in errors if isinstance(e, RemoteChanged)]
+    if changed:
+        os.remove(part_file)
+        os.remove(part_file + '.json')
+        raise changed[0]
+    save_part_meta(part_file, url, meta)
+    if errors:
+        raise errors[0]
+    if already:
+        print(f"[Direct] Resumed {desc} with {already} of {size} bytes already fetched")
+    return {k: meta.get(k) for k in ('etag', 'last_modified')}, received[0], len(ranges)
+
+
+def fetch_to_part(session, url, part_file, desc, range_parts=RANGE_PARTS):
+    """
+    Download `url` into `part_file`, resuming from its current size with an
+    If-Range request when the earlier partial response had an ETag or
+    Last-Modified. Large files on servers that accept byte ranges are split
+    across `range_parts` connections (fetch_ranges); anything else streams
+    over one. Returns (validators, bytes received, connections used).
+    """
+    meta = load_part_meta(part_file, url) if os.path.exists(part_file) else None
+    if meta and meta.get('ranges'):
+        return fetch_ranges(session, url, part_file, desc, meta, range_parts)
+
+    offset = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+    headers = {}
+    if offset and meta and (meta.get('etag') or meta.get('last_modified')):
+        headers['Range'] = f'bytes={offset}-'
+        # If the file changed since, the server sends it whole (200) instead of the range
+        headers['If-Range'] = meta.get('etag') or meta.get('last_modified')
+    else:
+        offset = 0
+
+    with session.get(url, stream=True, timeout=TIMEOUT, headers=headers) as r:
+        if r.status_code == 416 and offset:
+            # Nothing left to fetch when the part already holds the whole file
+            total = r.headers.get('Content-Range', '').rpartition('/')[2]
+            if total.isdigit() and int(total) == offset:
+                return {k: meta.get(k) for k in ('etag', 'last_modified')}, 0, 1
+            os.remove(part_file)
+            raise Exception("Partial download does not match the remote file; restarting")
+        r.raise_for_status()
+        if r.status_code != 206:
+            offset = 0
+        meta = validators(r)
+        expected = int(r.headers['Content-Length']) if 'Content-Length' in r.headers else None
+
+        # Splitting needs the size, range support and a validator to keep the ranges consistent
+        if (not offset and range_parts > 1 and expected and expected >= MIN_RANGE_SIZE
+                and r.headers.get('Accept-Ranges') == 'bytes' and (meta['etag'] or meta['last_modified'])):
+            meta['size'] = expected
+        else:
+            save_part_meta(part_file, url, meta)
+            received = 0
+            with open(part_file, 'ab' if offset else 'wb') as f, \
+                    tqdm(total=(expected or 0) + offset, initial=offset, unit='B', unit_scale=True, desc=desc) as bar:
+                for chunk in r.iter_content(chunk_size=STREAM_CHUNK):
+                    if chunk:
+                        f.write(chunk)
+                        received += len(chunk)
+                        bar.update(len(chunk))
+            if expected is not None and received != expected:
+                raise Exception(f"Connection closed after {received} of {expected} bytes")
+            if offset:
+                print(f"[Direct] Resumed {desc} from byte {offset}")
+            return meta, received, 1
+
+    # The probe response is closed unread; the ranges are fetched on new connections
+    return fetch_ranges(session, url, part_file, desc, meta, range_parts)
+
+
+def revalidate(session, url, entry):
+    """True when the server confirms (304) that the recorded version is still current"""
+    headers = {}
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    if not headers:
+        # No validators recorded; nothing to compare against
+        return True
+    with session.get(url, stream=True, timeout=TIMEOUT, headers=headers) as r:
+        if r.status_code == 304:
+            return True
+        r.raise_for_status()
+        return False
+
+
+def remote_size(session, url):
+    """Content-Length from a HEAD request, or None when the server does not give one"""
+    try:
+        r = session.head(url, timeout=TIMEOUT, allow_redirects=True)
+        r.raise_for_status()
+    except requests.RequestException:
+        return None
+    length = r.headers.get('Content-Length')
+    return int(length) if length and length.isdigit() else None
+
+
+def format_throughput(received, elapsed, connections):
+    rate = received / elapsed / (1024 * 1024) if elapsed > 0 else 0.0
+    plural = 's' if connections != 1 else ''
+    return f"{received / (1024 * 1024):.1f} MB in {elapsed:.1f}s, {rate:.2f} MB/s over {connections} connection{plural}"
+
+
+def download_direct(session, manifest, url, folder, filename, key, revalidate_remote=True, range_parts=RANGE_PARTS):
+    dest_dir = os.path.join(DATA_DIR, folder)
+    os.makedirs(dest_dir, exist_ok=True)
+    dest_file = os.path.join(dest_dir, filename)
+    part_file = dest_file + '.part'
+    entry = manifest.get(dest_file)
+
+    if os.path.exists(dest_file):
+        if entry is None:
+            # Downloaded before the manifest existed: adopt it only if it looks complete
+            size = os.path.getsize(dest_file)
+            expected = remote_size(session, url)
+            if size and (expected is None or expected == size):
+                manifest.put(dest_file, {'url': url, 'sha256': sha256_file(dest_file),
+                                         'size': size, 'etag': None, 'last_modified': None})
+                print(f"[Direct] File already exists, recorded in manifest: {dest_file}")
+                results[key] = 'Already exists'
+                return
+            print(f"[Direct] Existing {dest_file} is incomplete ({size} of {expected or '?'} bytes); downloading again")
+        elif entry.get('url') != url:
+            print(f"[Direct] URL changed for {dest_file}; downloading again")
+        elif sha256_file(dest_file) != entry['sha256']:
+            print(f"[Direct] Checksum mismatch for {dest_file}; downloading again")
+        else:
+            try:
+                current = not revalidate_remote or revalidate(session, url, entry)
+            except Exception as e:
+                print(f"[Direct] Could not revalidate {url} ({e}); keeping the verified copy")
+                current = True
+            if current:
+                print(f"[Direct] Verified, up to date: {dest_file}")
+                results[key] = 'Already exists (verified)'
+                return
+            print(f"[Direct] Remote file changed: {url}")
+
+    for attempt in range(MAX_RETRIES):
+        try:
+            print(f"[Direct] Downloading {url} to {dest_file} ... (attempt {attempt + 1}/{MAX_RETRIES})")
+            started = time.perf_counter()
+            meta, received, connections = fetch_to_part(session, url, part_file, filename, range_parts)
+            throughput = format_throughput(received, time.perf_counter() - started, connections)
+            size = os.path.getsize(part_file)
+            if size == 0:
+                raise Exception("Downloaded file is empty")
+            digest = sha256_file(part_file)
+            os.replace(part_file, dest_file)
+            if os.path.exists(part_file + '.json'):
+                os.remove(part_file + '.json')
+            manifest.put(dest_file, {'url': url, 'sha256': digest, 'size': size, **meta})
+            print(f"[Direct] Successfully downloaded {filename} ({size} bytes; {throughput})")
+            results[key] = f'Success ({throughput})'
+            return
+        except Exception as e:
+            # The .part file is kept so the next attempt resumes where this one stopped
+            print(f"[Direct] Attempt {attempt + 1} failed for {url}: {e}")
+            status = getattr(getattr(e, 'response', None), 'status_code', None)
+            if status is not None and 400 <= status < 500 and status not in (408, 429):
+                results[key] = f'Error: {e}'
+                return
+            if attempt == MAX_RETRIES - 1:
+                results[key] = f'Error after {MAX_RETRIES} attempts: {e}'
+                print(f"[Direct] Giving up on {url} after {MAX_RETRIES} attempts")
+            else:
+                time.sleep(5 * (attempt + 1))  # Exponential backoff
+
 
 def download_huggingface(dataset_name, folder, key, config=None, split=None):
-    dest = os.path.join('data', folder)
+    from datasets import load_dataset
+    dest = os.path.join(DATA_DIR, folder)
     os.makedirs(dest, exist_ok=True)
     try:
         print(f"[HF] Downloading {dataset_name} to {dest} ...")
@@ -37,8 +360,17 @@ def download_huggingface(dataset_name, folder, key, config=None, split=None):
     except Exception as e:
         results[key] = f'Error: {e}'
 
-def download_kaggle(dataset_name, folder, key):
-    dest = os.path.join('data', folder)
+
+def make_kaggle_api():
+    from kaggle.api.kaggle_api_extended import KaggleApi
+    os.environ['KAGGLE_CONFIG_DIR'] = os.path.abspath('credentials')
+    api = KaggleApi()
+    api.authenticate()
+    return api
+
+
+def download_kaggle(api, dataset_name, folder, key):
+    dest = os.path.join(DATA_DIR, folder)
     os.makedirs(dest, exist_ok=True)
     try:
         print(f"[Kaggle] Downloading {dataset_name} to {dest} ...")
@@ -47,91 +379,53 @@ def download_kaggle(dataset_name, folder, key):
     except Exception as e:
         results[key] = f'Error: {e}'
 
-def download_direct(url, folder, filename, key):
-    dest_dir = os.path.join('data', folder)
-    os.makedirs(dest_dir, exist_ok=True)
-    dest_file = os.path.join(dest_dir, filename)
-    
-    # Skip if file already exists
-    if os.path.exists(dest_file) and os.path.getsize(dest_file) > 0:
-        print(f"[Direct] File already exists: {dest_file}")
-        results[key] = 'Already exists'
-        return
-    
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            print(f"[Direct] Downloading {url} to {dest_file} ... (attempt {attempt + 1}/{max_retries})")
-            
-            # Enhanced headers to avoid being blocked
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Accept': 'application/pdf,application/octet-stream,*/*',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'DNT': '1',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-            }
-            
-            # Longer timeout and session for better connection handling
-            session = requests.Session()
-            session.headers.update(headers)
-            
-            with session.get(url, stream=True, timeout=(30, 60)) as r:
-                r.raise_for_status()
-                total = int(r.headers.get('content-length', 0))
-                
-                with open(dest_file, 'wb') as f, tqdm(total=total, unit='B', unit_scale=True, desc=filename) as bar:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            bar.update(len(chunk))
-            
-            # Verify file was downloaded correctly
-            if os.path.exists(dest_file) and os.path.getsize(dest_file) > 0:
-                print(f"[Direct] Successfully downloaded {filename} ({os.path.getsize(dest_file)} bytes)")
-                results[key] = 'Success'
-                return
-            else:
-                raise Exception("Downloaded file is empty or doesn't exist")
-                
-        except Exception as e:
-            print(f"[Direct] Attempt {attempt + 1} failed for {url}: {e}")
-            
-            # Clean up partial download
-            if os.path.exists(dest_file):
-                os.remove(dest_file)
-            
-            if attempt == max_retries - 1:
-                results[key] = f'Error after {max_retries} attempts: {e}'
-                print(f"[Direct] Giving up on {url} after {max_retries} attempts")
-            else:
-                import time
-                time.sleep(5 * (attempt + 1))  # Exponential backoff
 
-def dispatch_download(d, key):
-    if d['type'] == 'huggingface':
-        # Support optional config and split
-        config = d.get('config')
-        split = d.get('split')
-        download_huggingface(d['name'], d['folder'], key, config, split)
-    elif d['type'] == 'kaggle':
-        download_kaggle(d['name'], d['folder'], key)
-    elif d['type'] == 'direct':
-        download_direct(d['url'], d['folder'], d['filename'], key)
-    else:
-        results[key] = f"Unknown type: {d['type']}"
+def dispatch_download(d, key, session, manifest, kaggle_api, revalidate_remote, range_parts):
+    try:
+        if d['type'] == 'huggingface':
+            # Support optional config and split
+            download_huggingface(d['name'], d['folder'], key, d.get('config'), d.get('split'))
+        elif d['type'] == 'kaggle':
+            download_kaggle(kaggle_api, d['name'], d['folder'], key)
+        elif d['type'] == 'direct':
+            download_direct(session, manifest, d['url'], d['folder'], d['filename'], key, revalidate_remote, range_parts)
+        else:
+            results[key] = f"Unknown type: {d['type']}"
+    except Exception as e:
+        results[key] = f'Error: {e}'
+
+
+def main():
+    global DATA_DIR
+    parser = argparse.ArgumentParser(description="Download every dataset and PDF in datasets_to_download.json")
+    parser.add_argument("--config", default=DATASETS_FILE, help="Datasets to download")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Directory the datasets are downloaded into")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="Downloads running at once")
+    parser.add_argument("--range-parts", type=int, default=RANGE_PARTS,
+                        help="Concurrent byte ranges per large direct download (1 disables splitting)")
+    parser.add_argument("--no-revalidate", action="store_true",
+                        help="Skip verified files without asking the server whether they changed")
+    args = parser.parse_args()
+    DATA_DIR = args.data_dir
+
+    with open(args.config) as f:
+        datasets = json.load(f)
+
+    # Setup Kaggle API only if needed
+    kaggle_api = make_kaggle_api() if any(d['type'] == 'kaggle' for d in datasets) else None
+    session = make_session(args.workers * max(1, args.range_parts))
+    manifest = Manifest(os.path.join(DATA_DIR, MANIFEST_FILE))
+
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for d in datasets:
+            key = d.get('name') or d.get('url')
+            pool.submit(dispatch_download, d, key, session, manifest, kaggle_api, not args.no_revalidate,
+                        args.range_parts)
 
-for i, d in enumerate(DATASETS):
-    key = d.get('name') or d.get('url')
-    t = threading.Thread(target=dispatch_download, args=(d, key))
-    t.start()
-    threads.append(t)
+    print("\nAll downloads finished. Summary:")
+    for key, output in results.items():
+        print(f"\n--- {key} ---\n{output}")
 
-for t in threads:
-    t.join()
 
-print("\nAll downloads finished. Summary:")
-for key, output in results.items():
-    print(f"\n--- {key} ---\n{output}") 
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,33 @@
 import os
 import argparse
 import json
+import time
+import queue
+import random
+import threading
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
-from datasets import load_dataset, concatenate_datasets
+from datasets import Dataset, load_dataset, load_dataset_builder, concatenate_datasets
 from tqdm import tqdm
 import ollama
 from openai import OpenAI
 import dotenv
+from sample_log import SampleLog, question_hash, generation_key, judge_key
 dotenv.load_dotenv()
 
-def make_ollama_client():
-    host = "http://localhost:11434"
+DEFAULT_OLLAMA_HOST = "http://localhost:11434"
+DEFAULT_OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+def make_ollama_client(host: str = DEFAULT_OLLAMA_HOST):
     return ollama.Client(host=host)
 
-def make_openrouter_client(referrer: str = "", title: str = ""):
+def make_openrouter_client(referrer: str = "", title: str = "", base_url: str = DEFAULT_OPENROUTER_BASE_URL):
     api_key = os.getenv('OPENROUTER_API_KEY')
     if not api_key:
         raise RuntimeError("OPENROUTER_API_KEY is not set")
     client = OpenAI(
-        base_url="https://openrouter.ai/api/v1",
+        base_url=base_url,
         api_key=api_key,
     )
     headers = {}
@@ -37,21 +45,55 @@ MEDICAL_SYSTEM = (
     "Respond in English only."
 )
 
-def ollama_chat(client, model, system, user, temperature=0.2, max_tokens=512):
-    resp = client.chat(
+def ollama_chat_timed(client, model, system, user, temperature=0.2, max_tokens=512):
+    """
+    Streaming chat that also returns generation metrics: wall-clock time to first
+    token and total, plus Ollama's own token counts and durations (nanoseconds in
+    the final chunk, converted to seconds).
+    """
+    started = time.perf_counter()
+    first_token = None
+    parts = []
+    final = {}
+    for chunk in client.chat(
         model=model,
         messages=[
             {"role": "system", "content": system or ""},
             {"role": "user", "content": user},
         ],
         options={"temperature": float(temperature), "num_predict": int(max_tokens)},
-        stream=False,
-    )
-    msg = resp.get("message", {})
-    return (msg.get("content") or "").strip()
+        stream=True,
+    ):
+        content = (chunk.get("message") or {}).get("content") or ""
+        if content and first_token is None:
+            first_token = time.perf_counter()
+        parts.append(content)
+        if chunk.get("done"):
+            final = chunk
+    ended = time.perf_counter()
+
+    def seconds(field):
+        value = final.get(field)
+        return value / 1e9 if value else None
+
+    eval_count = final.get("eval_count")
+    eval_s = seconds("eval_duration")
+    metrics = {
+        "ttft_s": round(first_token - started, 4) if first_token else None,
+        "wall_s": round(ended - started, 4),
+        "total_duration_s": seconds("total_duration"),
+        "load_duration_s": seconds("load_duration"),
+        "prompt_eval_count": final.get("prompt_eval_count"),
+        "prompt_eval_s": seconds("prompt_eval_duration"),
+        "eval_count": eval_count,
+        "eval_s": eval_s,
+        "tokens_per_s": round(eval_count / eval_s, 2) if eval_count and eval_s else None,
+    }
+    return "".join(parts).strip(), metrics
 
 def generate_prediction(ollama_client, gen_model, question, temperature, max_tokens):
-    return ollama_chat(
+    """Return (prediction, generation metrics)"""
+    return ollama_chat_timed(
         client=ollama_client,
         model=gen_model,
         system=MEDICAL_SYSTEM,
@@ -60,17 +102,21 @@ def generate_prediction(ollama_client, gen_model, question, temperature, max_tok
         max_tokens=max_tokens,
     )
 
+JUDGE_INSTRUCTIONS = (
+    "You are an expert medical evaluator. Given a question, the ground-truth answer (gold), "
+    "and a prediction from another AI, your job is to provide a one-word judgment: "
+    "'CORRECT' if the prediction would be accepted by a medical examiner as a clinically accurate and sufficient answer, "
+    "'INCORRECT' if it misses clinically essential information, contains significant errors, or would mislead a healthcare professional. "
+    "Minor differences in wording, detail, or additional correct information should not make the answer incorrect as long as the main clinical content is present. "
+    "If the prediction covers all clinically important points—even if the style or extra details differ from the gold—it is CORRECT. "
+)
+
 def openrouter_judge(client, extra_headers, model, question, gold, prediction):
     content = [
         {
             "type": "text",
             "text": (
-                "You are an expert medical evaluator. Given a question, the ground-truth answer (gold), "
-                "and a prediction from another AI, your job is to provide a one-word judgment: "
-                "'CORRECT' if the prediction would be accepted by a medical examiner as a clinically accurate and sufficient answer, "
-                "'INCORRECT' if it misses clinically essential information, contains significant errors, or would mislead a healthcare professional. "
-                "Minor differences in wording, detail, or additional correct information should not make the answer incorrect as long as the main clinical content is present. "
-                "If the prediction covers all clinically important points—even if the style or extra details differ from the gold—it is CORRECT. "
+                JUDGE_INSTRUCTIONS +
                 "Respond in English only. Only give your one-word verdict, nothing else.\n\n"
                 f"Question: ***{question}***\n"
                 f"Ground truth answer: ***{gold}***\n"
@@ -90,13 +136,285 @@ def openrouter_judge(client, extra_headers, model, question, gold, prediction):
         return "INCORRECT"
     return "INCORRECT"
 
-def build_dataset(name, limit_per_split):
-    ds = load_dataset(name)
+def parse_batch_verdicts(text, ids):
+    """
+    Parse a batched judge reply into {id: verdict}. Raises ValueError unless it
+    is a JSON array with exactly one CORRECT/INCORRECT verdict per expected id.
+    """
+    start, end = text.find("["), text.rfind("]")
+    if start < 0 or end < start:
+        raise ValueError("no JSON array in judge reply")
+    try:
+        entries = json.loads(text[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise ValueError(f"malformed JSON in judge reply: {e}")
+    verdicts = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            raise ValueError(f"unexpected entry in judge reply: {entry!r}")
+        try:
+            item_id = int(entry.get("id"))
+        except (TypeError, ValueError):
+            raise ValueError(f"entry without a valid id: {entry!r}")
+        verdict = str(entry.get("verdict", "")).strip().upper()
+        if verdict not in ("CORRECT", "INCORRECT"):
+            raise ValueError(f"invalid verdict for item {item_id}: {entry.get('verdict')!r}")
+        if item_id in verdicts:
+            raise ValueError(f"duplicate verdict for item {item_id}")
+        verdicts[item_id] = verdict
+    if set(verdicts) != set(ids):
+        raise ValueError(f"verdict ids {sorted(verdicts)} do not match items {sorted(ids)}")
+    return verdicts
+
+def openrouter_judge_batch(client, extra_headers, model, triples):
+    """
+    Judge several (question, gold, prediction) triples in one request, sharing
+    the instruction preamble. Returns one verdict per triple, in order; raises
+    ValueError when the reply does not line up with the items.
+    """
+    ids = list(range(1, len(triples) + 1))
+    items = "\n\n".join(
+        f"Item {i}:\n"
+        f"Question: ***{question}***\n"
+        f"Ground truth answer: ***{gold}***\n"
+        f"Prediction: ***{prediction}***"
+        for i, (question, gold, prediction) in zip(ids, triples)
+    )
+    content = [
+        {
+            "type": "text",
+            "text": (
+                JUDGE_INSTRUCTIONS +
+                f"Judge each of the {len(triples)} items below independently. Respond in English only, "
+                "with a JSON array and nothing else: one object per item, "
+                '{"id": <item number>, "verdict": "CORRECT" or "INCORRECT"}.\n\n' + items
+            )
+        }
+    ]
+    completion = client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": content}],
+        extra_headers=extra_headers,
+    )
+    verdicts = parse_batch_verdicts(completion.choices[0].message.content or "", ids)
+    return [verdicts[i] for i in ids]
+
+class JudgeBatcher:
+    """
+    Collects triples submitted by concurrent judge workers into batches of up to
+    `batch_size` and judges each batch in one request. A batch is sent once it
+    is full or `max_wait` seconds after its first triple arrived, so a slow
+    generation stage never stalls judging. When a batched reply is malformed or
+    the request fails, every triple of that batch is judged on its own.
+    """
+
+    def __init__(self, judge_batch, judge_one, batch_size, max_wait=2.0):
+        self.judge_batch = judge_batch
+        self.judge_one = judge_one
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._pending = []
+        self._opened = None
+        self.requests = 0
+        self.batches = 0
+        self.fallbacks = 0
+
+    def judge(self, question, gold, prediction):
+        """Return (verdict, size of the batch it was judged in); blocks until judged"""
+        slot = {"triple": (question, gold, prediction), "claimed": False, "done": False}
+        with self._cond:
+            if not self._pending:
+                self._opened = time.monotonic()
+            self._pending.append(slot)
+            self._cond.notify_all()
+            while not slot["done"]:
+                if slot["claimed"]:
+                    self._cond.wait()
+                    continue
+                batch = self._take_batch()
+                if batch is None:
+                    self._cond.wait(max(0.0, self._opened + self.max_wait - time.monotonic()))
+                    continue
+                # Whichever worker claims a batch sends it, possibly on behalf of others
+                self._cond.release()
+                try:
+                    self._send(batch)
+                finally:
+                    self._cond.acquire()
+        if isinstance(slot["verdict"], Exception):
+            raise slot["verdict"]
+        return slot["verdict"], slot["size"]
+
+    def _take_batch(self):
+        # Called with the lock held
+        if len(self._pending) < self.batch_size and time.monotonic() < self._opened + self.max_wait:
+            return None
+        batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+        self._opened = time.monotonic() if self._pending else None
+        for slot in batch:
+            slot["claimed"] = True
+        return batch
+
+    def _send(self, batch):
+        triples = [slot["triple"] for slot in batch]
+        verdicts, requests, fallback = None, 0, False
+        if len(triples) > 1:
+            requests += 1
+            try:
+                verdicts = self.judge_batch(triples)
+            except Exception as e:
+                fallback = True
+                print(f"WARNING: Batched judging of {len(triples)} items failed ({e}); judging them one by one")
+        if verdicts is None:
+            verdicts = []
+            for triple in triples:
+                requests += 1
+                try:
+                    verdicts.append(self.judge_one(*triple))
+                except Exception as e:
+                    # Fails only this sample, like an unbatched judge error
+                    verdicts.append(e)
+        with self._cond:
+            self.requests += requests
+            self.batches += len(triples) > 1
+            self.fallbacks += fallback
+            for slot, verdict in zip(batch, verdicts):
+                slot["verdict"], slot["size"], slot["done"] = verdict, len(batch), True
+            self._cond.notify_all()
+
+_DONE = object()
+
+def run_pipeline(items, stages, queue_size=8):
+    """
+    Run items through stages connected by bounded queues. Each stage is a
+    (fn, concurrency) pair served by its own worker threads; fn(item, value)
+    receives the previous stage's result (None for the first stage).
+
+    Yields (item, value, error) in input order. An item whose stage raised skips
+    the remaining stages and carries the exception as `error`.
+    """
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages] + [queue.Queue()]
+    # Bounds the items between the feeder and the consumer, including the reorder buffer
+    window = threading.Semaphore(queue_size * (len(stages) + 1) + sum(c for _, c in stages))
+
+    def feed():
+        for i, item in enumerate(items):
+            window.acquire()
+            queues[0].put((i, item, None, None))
+        for _ in range(stages[0][1]):
+            queues[0].put(_DONE)
+
+    def work(k, fn, remaining):
+        while True:
+            job = queues[k].get()
+            if job is _DONE:
+                break
+            i, item, value, error = job
+            if error is None:
+                try:
+                    value = fn(item, value)
+                except Exception as e:
+                    error = e
+            queues[k + 1].put((i, item, value, error))
+        # The last worker of a stage to finish tells every worker of the next stage
+        with remaining[1]:
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                next_workers = stages[k + 1][1] if k + 1 < len(stages) else 1
+                for _ in range(next_workers):
+                    queues[k + 1].put(_DONE)
+
+    threads = [threading.Thread(target=feed, daemon=True)]
+    for k, (fn, concurrency) in enumerate(stages):
+        remaining = [concurrency, threading.Lock()]
+        threads += [threading.Thread(target=work, args=(k, fn, remaining), daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+
+    pending, next_i = {}, 0
+    while True:
+        job = queues[-1].get()
+        if job is _DONE:
+            break
+        pending[job[0]] = job
+        while next_i in pending:
+            _, item, value, error = pending.pop(next_i)
+            next_i += 1
+            window.release()
+            yield item, value, error
+
+SAMPLE_POOL = 10000
+
+def sample_indices(strata, limit, seed):
+    """
+    Seeded sample of `limit` positions from a list of stratum labels, allocated
+    to strata in proportion to their size (largest remainder), returned sorted.
+    """
+    rng = random.Random(seed)
+    groups = {}
+    for pos, label in enumerate(strata):
+        groups.setdefault(label, []).append(pos)
+    limit = min(limit, len(strata))
+    quotas = {label: limit * len(members) / len(strata) for label, members in groups.items()}
+    counts = {label: int(q) for label, q in quotas.items()}
+    by_remainder = sorted(groups, key=lambda label: (quotas[label] - counts[label], rng.random()), reverse=True)
+    for label in by_remainder[:limit - sum(counts.values())]:
+        counts[label] += 1
+    picked = []
+    for label, members in groups.items():
+        picked.extend(rng.sample(members, counts[label]))
+    return sorted(picked)
+
+def _cached_splits(name):
+    """The prepared Arrow copy of a dataset when it is already in the local cache, else None"""
+    try:
+        builder = load_dataset_builder(name)
+        if not os.path.exists(os.path.join(builder.cache_dir, "dataset_info.json")):
+            return None
+        return builder.as_dataset()
+    except Exception:
+        return None
+
+def build_dataset(name, limit_per_split, seed=None, stratify_by=None, pool_size=SAMPLE_POOL):
+    """
+    Up to `limit_per_split` rows from every split, reading only what is needed.
+
+    A cached Arrow copy is memory-mapped and sliced; otherwise the dataset is
+    streamed and only the first rows are fetched. Without a seed the first rows
+    are taken, as before. With a seed the rows are a seeded sample, stratified by
+    the `stratify_by` column when given, drawn from the whole cached split or
+    from the first `pool_size` streamed rows.
+    """
+    sampling = seed is not None or stratify_by is not None
+    cached = _cached_splits(name)
     parts = []
-    for split_name in ds.keys():
-        split = ds[split_name]
-        n = min(limit_per_split, len(split))
-        parts.append(split.select(range(n)))
+    if cached is not None:
+        print(f"INFO: Reading {name} from the local Arrow cache")
+        for split_name, split in cached.items():
+            if sampling:
+                strata = split[stratify_by] if stratify_by else [None] * len(split)
+                indices = sample_indices(strata, limit_per_split, seed)
+            else:
+                indices = range(min(limit_per_split, len(split)))
+            parts.append(split.select(indices))
+    else:
+        print(f"INFO: Streaming {name}")
+        count = max(pool_size, limit_per_split) if sampling else limit_per_split
+        try:
+            # Streaming errors surface while iterating, so the rows are read inside the try
+            split_rows = {split_name: list(islice(split, count))
+                          for split_name, split in load_dataset(name, streaming=True).items()}
+        except Exception as e:
+            # Some loaders cannot stream; fall back to a full download
+            print(f"WARNING: Streaming {name} failed ({e}); loading it in full")
+            split_rows = {split_name: list(islice(split, count))
+                          for split_name, split in load_dataset(name).items()}
+        for split_name, rows in split_rows.items():
+            if sampling:
+                strata = [row.get(stratify_by) for row in rows] if stratify_by else [None] * len(rows)
+                rows = [rows[i] for i in sample_indices(strata, limit_per_split, seed)]
+            parts.append(Dataset.from_list(rows))
     return parts[0] if len(parts) == 1 else concatenate_datasets(parts)
 
 def ensure_results_md(md_path: Path):
@@ -104,7 +422,41 @@ def ensure_results_md(md_path: Path):
         md_path.parent.mkdir(parents=True, exist_ok=True)
         md_path.write_text("# Evaluations with Ollama + OpenRouter Judge\n\n", encoding="utf-8")
 
-def append_run_summary(md_path: Path, params: dict, accuracy: float, correct: int, total: int):
+LATENCY_FIELDS = [
+    ("ttft_s", "Time to first token (s)"),
+    ("tokens_per_s", "Generation speed (tokens/s)"),
+    ("prompt_eval_s", "Prompt eval (s)"),
+    ("total_duration_s", "Total duration (s)"),
+    ("wall_s", "Wall clock incl. network (s)"),
+]
+
+def percentile(values, q):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+def summarize_metrics(metrics_list):
+    """p50/p90/p99 (and mean, count) of each latency field over the samples that report it"""
+    summary = {}
+    for field, _ in LATENCY_FIELDS:
+        values = [m[field] for m in metrics_list if m and m.get(field) is not None]
+        if values:
+            summary[field] = {
+                "p50": round(percentile(values, 50), 4),
+                "p90": round(percentile(values, 90), 4),
+                "p99": round(percentile(values, 99), 4),
+                "mean": round(sum(values) / len(values), 4),
+                "n": len(values),
+            }
+    return summary
+
+def append_run_sidecar(path: Path, record: dict):
+    """Machine-readable twin of the results.md run block, one JSON line per run"""
+    with path.open("a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def append_run_summary(md_path: Path, params: dict, accuracy: float, correct: int, total: int, latency: dict = None):
     ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     block = []
     block.append(f"## Run — {ts}\n")
@@ -114,6 +466,81 @@ def append_run_summary(md_path: Path, params: dict, accuracy: float, correct: in
     block.append("```\n")
     block.append("**Summary**:\n")
     block.append(f"- Accuracy: **{accuracy:.2%}** ({correct}/{total})\n")
+    if latency:
+        block.append("**Generation latency**:\n")
+        block.append("| Metric | p50 | p90 | p99 | Mean | Samples |")
+        block.append("|--------|-----|-----|-----|------|---------|")
+        for field, label in LATENCY_FIELDS:
+            if field in latency:
+                m = latency[field]
+                block.append(f"| {label} | {m['p50']:.3f} | {m['p90']:.3f} | {m['p99']:.3f} | {m['mean']:.3f} | {m['n']} |")
+        block.append("")
+    block.append("---\n\n")
+    with md_path.open("a", encoding="utf-8") as f:
+        f.write("\n".join(block))
+
+def compare_models(models, stats):
+    """Accuracy, latency and per-item agreement of every model pair on the rows all of them answered"""
+    per_model = {}
+    for model in models:
+        st = stats[model]
+        latency = st.get("latency", {})
+        per_model[model] = {
+            "accuracy": st.get("accuracy", 0.0),
+            "correct": st["correct"],
+            "total": st["total"],
+            "ttft_p50_s": latency.get("ttft_s", {}).get("p50"),
+            "tokens_per_s_p50": latency.get("tokens_per_s", {}).get("p50"),
+            "wall_p50_s": latency.get("wall_s", {}).get("p50"),
+        }
+    pairs = []
+    for a_i, a in enumerate(models):
+        for b in models[a_i + 1:]:
+            shared = sorted(set(stats[a]["verdicts"]) & set(stats[b]["verdicts"]))
+            both = only_a = only_b = neither = 0
+            for i in shared:
+                a_ok = stats[a]["verdicts"][i] == "CORRECT"
+                b_ok = stats[b]["verdicts"][i] == "CORRECT"
+                both += a_ok and b_ok
+                only_a += a_ok and not b_ok
+                only_b += b_ok and not a_ok
+                neither += not a_ok and not b_ok
+            pairs.append({
+                "a": a, "b": b, "items": len(shared),
+                "both_correct": both, "only_a": only_a, "only_b": only_b, "both_incorrect": neither,
+                "agreement": (both + neither) / len(shared) if shared else 0.0,
+            })
+    return {"models": per_model, "pairs": pairs}
+
+def _fmt(value, spec):
+    return format(value, spec) if value is not None else "-"
+
+def print_comparison(comparison):
+    print("\n=== Model comparison ===")
+    for model, m in comparison["models"].items():
+        print(f"{model}: {m['accuracy']:.2%} ({m['correct']}/{m['total']}) | "
+              f"TTFT p50 {_fmt(m['ttft_p50_s'], '.3f')}s | {_fmt(m['tokens_per_s_p50'], '.1f')} tok/s")
+    for p in comparison["pairs"]:
+        print(f"{p['a']} vs {p['b']}: agreement {p['agreement']:.2%} on {p['items']} items, "
+              f"only {p['a']} correct {p['only_a']}, only {p['b']} correct {p['only_b']}")
+
+def append_comparison_summary(md_path: Path, run_id: str, dataset: str, judge: str, comparison: dict):
+    block = []
+    block.append(f"## Comparison — {run_id}\n")
+    block.append(f"**Dataset**: `{dataset}` — **Judge**: `{judge}`\n")
+    block.append("| Model | Accuracy | Correct | TTFT p50 (s) | Tokens/s p50 | Wall p50 (s) |")
+    block.append("|-------|----------|---------|--------------|--------------|--------------|")
+    for model, m in comparison["models"].items():
+        block.append(f"| {model} | {m['accuracy']:.2%} | {m['correct']}/{m['total']} | "
+                     f"{_fmt(m['ttft_p50_s'], '.3f')} | {_fmt(m['tokens_per_s_p50'], '.1f')} | {_fmt(m['wall_p50_s'], '.3f')} |")
+    block.append("")
+    block.append("**Paired agreement** (same rows, same judge):\n")
+    block.append("| A | B | Items | Both correct | Only A | Only B | Both incorrect | Agreement |")
+    block.append("|---|---|-------|--------------|--------|--------|----------------|-----------|")
+    for p in comparison["pairs"]:
+        block.append(f"| {p['a']} | {p['b']} | {p['items']} | {p['both_correct']} | {p['only_a']} | "
+                     f"{p['only_b']} | {p['both_incorrect']} | {p['agreement']:.2%} |")
+    block.append("")
     block.append("---\n\n")
     with md_path.open("a", encoding="utf-8") as f:
         f.write("\n".join(block))
@@ -121,55 +548,197 @@ def append_run_summary(md_path: Path, params: dict, accuracy: float, correct: in
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--dataset", default="lextale/FirstAidInstructionsDataset")
-    ap.add_argument("--gen-model", default="gemma3n")
+    ap.add_argument("--gen-model", nargs="+", default=["gemma3n"],
+                    help="One or more Ollama models; several are evaluated on the same rows and compared")
+    ap.add_argument("--model-order", choices=["interleaved", "grouped"], default="interleaved",
+                    help="Interleave models per row (overlapping their generation) or run them one after another")
     ap.add_argument("--limit", type=int, default=20)
+    ap.add_argument("--seed", type=int, default=None,
+                    help="Sample rows with this seed instead of taking the first --limit of each split")
+    ap.add_argument("--stratify-by", default=None,
+                    help="Column whose values are sampled proportionally (implies sampling; seed 0 if unset)")
+    ap.add_argument("--sample-pool", type=int, default=SAMPLE_POOL,
+                    help="Streamed rows per split to sample from when the dataset is not cached locally")
     ap.add_argument("--gen-temperature", type=float, default=0.2)
     ap.add_argument("--gen-max-new-tokens", type=int, default=512)
     ap.add_argument("--openrouter-model", default="google/gemini-2.5-flash-lite-preview-06-17")
     ap.add_argument("--openrouter-referrer", default="https://huggingface.co/ericrisco/medical-gemma-3n-4b")
     ap.add_argument("--openrouter-title", default="EVALUATION GEMMA")
+    ap.add_argument("--ollama-host", default=os.getenv("OLLAMA_HOST", DEFAULT_OLLAMA_HOST))
+    ap.add_argument("--openrouter-base-url", default=os.getenv("OPENROUTER_BASE_URL", DEFAULT_OPENROUTER_BASE_URL))
+    ap.add_argument("--gen-concurrency", type=int, default=1,
+                    help="Generation requests in flight (match OLLAMA_NUM_PARALLEL)")
+    ap.add_argument("--judge-concurrency", type=int, default=4,
+                    help="Judge requests in flight")
+    ap.add_argument("--judge-batch-size", type=int, default=1,
+                    help="Samples judged per request; above 1 the judge returns a JSON verdict array")
+    ap.add_argument("--judge-batch-wait", type=float, default=2.0,
+                    help="Seconds a partial judge batch waits for more samples before it is sent")
+    ap.add_argument("--queue-size", type=int, default=8,
+                    help="Predictions buffered between generation and judging")
     ap.add_argument("--print-samples", action="store_true")
     ap.add_argument("--progress", action="store_true")
     ap.add_argument("--output-dir", default="results")
     ap.add_argument("--md-file", default="results.md")
+    ap.add_argument("--samples-file", default="samples.jsonl",
+                    help="Per-sample log in the output dir; cached predictions and verdicts are reused from it")
+    ap.add_argument("--runs-file", default="runs.jsonl",
+                    help="Machine-readable run summaries (accuracy and latency percentiles) in the output dir")
+    ap.add_argument("--no-cache", action="store_true",
+                    help="Regenerate and re-judge every sample (results are still logged)")
     args = ap.parse_args()
 
-    ollama_client = make_ollama_client()
-    or_client, or_headers = make_openrouter_client(args.openrouter_referrer, args.openrouter_title)
-    data = build_dataset(args.dataset, args.limit)
+    ollama_client = make_ollama_client(args.ollama_host)
+    or_client, or_headers = make_openrouter_client(args.openrouter_referrer, args.openrouter_title, args.openrouter_base_url)
+    seed = args.seed if args.seed is not None or not args.stratify_by else 0
+    data = build_dataset(args.dataset, args.limit, seed=seed, stratify_by=args.stratify_by, pool_size=args.sample_pool)
 
     out_dir = Path(args.output_dir)
     md_path = out_dir / args.md_file
     ensure_results_md(md_path)
     out_dir.mkdir(parents=True, exist_ok=True)
+    sample_log = SampleLog(str(out_dir / args.samples_file))
+    run_id = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    gen_params = {"temperature": args.gen_temperature, "max_tokens": args.gen_max_new_tokens}
+
+    models = args.gen_model
+    stats = {
+        model: {"correct": 0, "total": 0, "errors": 0, "metrics": [], "verdicts": {}}
+        for model in models
+    }
+    reused_predictions = 0
+    reused_verdicts = 0
+
+    def question_of(row):
+        return row["question"] if "question" in row else row.get("prompt", "")
 
-    correct = 0
-    total = 0
+    def gold_of(row):
+        return row["answer"] if "answer" in row else row.get("gold", "")
 
-    for row in tqdm(data, desc="Evaluating"):
-        q = row["question"] if "question" in row else row.get("prompt", "")
-        gold = row["answer"] if "answer" in row else row.get("gold", "")
-        pred = generate_prediction(
+    def generate_stage(item, _):
+        _, row, model = item
+        q = question_of(row)
+        sample = {
+            "run": run_id,
+            "dataset": args.dataset,
+            "question_hash": question_hash(q),
+            "question": q,
+            "gold": gold_of(row),
+            "gen_key": generation_key(model, MEDICAL_SYSTEM, q, gen_params),
+            "gen_model": model,
+            "gen_params": gen_params,
+            "prediction": None,
+            "gen_latency_s": None,
+            "gen_metrics": None,
+            "judge_model": args.openrouter_model,
+            "judge_key": None,
+            "verdict": None,
+            "judge_latency_s": None,
+        }
+        cached = None if args.no_cache else sample_log.predictions.get(sample["gen_key"])
+        if cached is not None:
+            sample["prediction"] = cached["prediction"]
+            sample["gen_metrics"] = cached.get("gen_metrics")
+            sample["prediction_cached"] = True
+            return sample
+        started = time.perf_counter()
+        sample["prediction"], sample["gen_metrics"] = generate_prediction(
             ollama_client=ollama_client,
-            gen_model=args.gen_model,
+            gen_model=model,
             question=q,
             temperature=args.gen_temperature,
             max_tokens=args.gen_max_new_tokens,
         )
-        verdict = openrouter_judge(
+        sample["gen_latency_s"] = round(time.perf_counter() - started, 3)
+        return sample
+
+    def judge_one(question, gold, prediction):
+        return openrouter_judge(
             client=or_client,
             extra_headers=or_headers,
             model=args.openrouter_model,
-            question=q,
+            question=question,
             gold=gold,
-            prediction=pred,
+            prediction=prediction,
+        )
+
+    batcher = None
+    if args.judge_batch_size > 1:
+        batcher = JudgeBatcher(
+            lambda triples: openrouter_judge_batch(or_client, or_headers, args.openrouter_model, triples),
+            judge_one,
+            args.judge_batch_size,
+            max_wait=args.judge_batch_wait,
         )
-        total += 1
+
+    def judge_stage(item, sample):
+        sample["judge_key"] = judge_key(
+            args.openrouter_model, JUDGE_INSTRUCTIONS, sample["question"], sample["gold"], sample["prediction"]
+        )
+        cached = None if args.no_cache else sample_log.verdict(sample["judge_key"])
+        if cached is not None:
+            sample["verdict"] = cached
+            sample["verdict_cached"] = True
+            return sample
+        started = time.perf_counter()
+        if batcher is not None:
+            sample["verdict"], sample["judge_batch_size"] = batcher.judge(
+                sample["question"], sample["gold"], sample["prediction"]
+            )
+        else:
+            sample["verdict"] = judge_one(sample["question"], sample["gold"], sample["prediction"])
+        sample["judge_latency_s"] = round(time.perf_counter() - started, 3)
+        return sample
+
+    def log_sample(sample):
+        prediction_cached = sample.pop("prediction_cached", False)
+        verdict_cached = sample.pop("verdict_cached", False)
+        # Only new work is logged; a fully cached sample is already in the log
+        if not (prediction_cached and verdict_cached):
+            sample_log.append(sample)
+
+    # Every model sees the same rows. Interleaving keeps all models' generations in
+    # flight together; grouped order avoids swapping models on a memory-bound host.
+    if args.model_order == "interleaved":
+        items = [(i, row, model) for i, row in enumerate(data) for model in models]
+    else:
+        items = [(i, row, model) for model in models for i, row in enumerate(data)]
+
+    # Generation and judging overlap; results still arrive in item order. With
+    # batching, each judge request in flight needs a full batch of waiting workers.
+    judge_workers = args.judge_concurrency * max(1, args.judge_batch_size)
+    results = run_pipeline(
+        items,
+        [(generate_stage, args.gen_concurrency), (judge_stage, judge_workers)],
+        queue_size=args.queue_size,
+    )
+    for (i, row, model), sample, error in tqdm(results, total=len(items), desc="Evaluating"):
+        st = stats[model]
+        q = question_of(row)
+        gold = gold_of(row)
+        tag = f"[{model}] " if len(models) > 1 else ""
+        if error is not None:
+            st["errors"] += 1
+            print(f"WARNING: {tag}Skipping sample after error: {error}")
+            # Keep a prediction whose judging failed, so the next run only re-judges it
+            if sample is not None and sample.get("prediction") is not None and not sample.get("prediction_cached"):
+                sample_log.append(dict(sample, error=str(error)))
+            continue
+        reused_predictions += bool(sample.get("prediction_cached"))
+        reused_verdicts += bool(sample.get("verdict_cached"))
+        st["metrics"].append(sample.get("gen_metrics"))
+        log_sample(sample)
+        pred, verdict = sample["prediction"], sample["verdict"]
+        st["verdicts"][i] = verdict
+        st["total"] += 1
         if verdict == "CORRECT":
-            correct += 1
+            st["correct"] += 1
+        correct, total = st["correct"], st["total"]
 
         if args.print_samples:
             print("\n---")
+            if tag:
+                print("MODEL:", model)
             print("Q:", q)
             print("GOLD:", gold)
             print("PRED:", pred)
@@ -177,22 +746,60 @@ def main():
             print(f"RUN ACCURACY: {correct}/{total} = {correct/total:.2%}")
 
         elif args.progress:
-            print(f"VERDICT: {verdict} | ACC: {correct}/{total} = {correct/total:.2%}")
-
-    accuracy = correct / total if total else 0.0
-    print(f"\nFinal Accuracy: {accuracy:.2%}  ({correct}/{total})")
-
-    params = {
-        "dataset": args.dataset,
-        "gen_model": args.gen_model,
-        "limit": args.limit,
-        "gen_temperature": args.gen_temperature,
-        "gen_max_new_tokens": args.gen_max_new_tokens,
-        "openrouter_model": args.openrouter_model,
-        "output_dir": str(out_dir),
-        "md_file": args.md_file,
-    }
-    append_run_summary(md_path, params, accuracy, correct, total)
+            print(f"{tag}VERDICT: {verdict} | ACC: {correct}/{total} = {correct/total:.2%}")
+
+    print(f"INFO: Reused {reused_predictions} cached predictions and {reused_verdicts} cached verdicts from {sample_log.path}")
+    if batcher is not None and batcher.requests:
+        judged = sum(st["total"] for st in stats.values()) - reused_verdicts
+        print(f"INFO: Judged {judged} samples in {batcher.requests} requests "
+              f"({batcher.batches} batches of up to {args.judge_batch_size}, {batcher.fallbacks} fell back to single items)")
+    sample_log.close()
+
+    for model in models:
+        st = stats[model]
+        correct, total = st["correct"], st["total"]
+        accuracy = correct / total if total else 0.0
+        st["accuracy"] = accuracy
+        print(f"\n{'[' + model + '] ' if len(models) > 1 else ''}Final Accuracy: {accuracy:.2%}  ({correct}/{total})")
+        if st["errors"]:
+            print(f"WARNING: {st['errors']} samples failed and are not counted")
+
+        params = {
+            "dataset": args.dataset,
+            "gen_model": model,
+            "limit": args.limit,
+            "seed": seed,
+            "stratify_by": args.stratify_by,
+            "gen_temperature": args.gen_temperature,
+            "gen_max_new_tokens": args.gen_max_new_tokens,
+            "openrouter_model": args.openrouter_model,
+            "judge_batch_size": args.judge_batch_size,
+            "output_dir": str(out_dir),
+            "md_file": args.md_file,
+        }
+        # Cached predictions keep the metrics measured when they were generated
+        latency = summarize_metrics(st["metrics"])
+        st["latency"] = latency
+        for field, label in LATENCY_FIELDS:
+            if field in latency:
+                m = latency[field]
+                print(f"{label}: p50 {m['p50']:.3f} | p90 {m['p90']:.3f} | p99 {m['p99']:.3f}")
+        append_run_summary(md_path, params, accuracy, correct, total, latency)
+        append_run_sidecar(out_dir / args.runs_file, {
+            "run": run_id,
+            "params": params,
+            "accuracy": accuracy,
+            "correct": correct,
+            "total": total,
+            "errors": st["errors"],
+            "latency": latency,
+        })
+
+    if len(models) > 1:
+        comparison = compare_models(models, stats)
+        print_comparison(comparison)
+        append_comparison_summary(md_path, run_id, args.dataset, args.openrouter_model, comparison)
+        append_run_sidecar(out_dir / args.runs_file, {"run": run_id, "comparison": comparison})
 
 if __name__ == "__main__":
     main()
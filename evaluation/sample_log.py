@@ -0,0 +1,103 @@
+"""
+Append-only per-sample evaluation log.
+
+Every evaluated sample is written as one JSON line with the question hash,
+generation model and parameters, prediction, judge model, verdict and
+latencies. Loading the log indexes predictions by generation key and verdicts
+by judge key, so an interrupted run resumes where it stopped and re-judging an
+unchanged model (or comparing judges) never regenerates predictions.
+"""
+import os
+import json
+import hashlib
+import threading
+
+
+def _hash(*parts):
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _repair_tail(path, chunk_size=64 * 1024):
+    """Truncate a torn last line left by a killed run, so the next record starts on its own line"""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        while pos > 0:
+            start = max(0, pos - chunk_size)
+            f.seek(start)
+            newline = f.read(pos - start).rfind(b"\n")
+            if newline >= 0:
+                pos = start + newline + 1
+                break
+            pos = start
+        if pos < end:
+            f.truncate(pos)
+            print(f"WARNING: Dropped a torn last line ({end - pos} bytes) from {path}")
+
+
+def question_hash(question):
+    return hashlib.sha256((question or "").encode("utf-8")).hexdigest()
+
+
+def generation_key(model, system, question, params):
+    """Identifies a prediction: same model, prompts and sampling parameters"""
+    return _hash("generation", model, system, question, params)
+
+
+def judge_key(model, instructions, question, gold, prediction):
+    """Identifies a verdict: same judge model and instructions on the same triple"""
+    return _hash("judge", model, instructions, question, gold, prediction)
+
+
+class SampleLog:
+    def __init__(self, path):
+        self.path = path
+        self.predictions = {}
+        self.verdicts = {}
+        self._lock = threading.Lock()
+        self._file = None
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        count = 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn last line from an interrupted run
+                    continue
+                count += 1
+                if record.get("prediction") is not None:
+                    self.predictions[record["gen_key"]] = record
+                if record.get("verdict") is not None:
+                    self.verdicts[record["judge_key"]] = record
+        print(f"INFO: Loaded {count} logged samples from {self.path} "
+              f"({len(self.predictions)} predictions, {len(self.verdicts)} verdicts)")
+
+    def verdict(self, key):
+        record = self.verdicts.get(key)
+        return record["verdict"] if record else None
+
+    def append(self, record):
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                _repair_tail(self.path)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            if record.get("prediction") is not None:
+                self.predictions[record["gen_key"]] = record
+            if record.get("verdict") is not None:
+                self.verdicts[record["judge_key"]] = record
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None